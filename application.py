@@ -1,20 +1,34 @@
+from quadrenderer import precompile
+precompile.configureCache() # before anything imports numba
 from kivy.app import App
 from kivy.uix.widget import Widget
 from kivy.uix.scatter import Scatter
 from kivy.uix.floatlayout import FloatLayout
 from kivy.uix.stacklayout import StackLayout
 from kivy.uix.textinput import TextInput
+from kivy.uix.label import Label
 from kivy.graphics.transformation import Matrix
 from kivy.graphics.texture import Texture
 from kivy.clock import Clock
 from kivy.graphics import Rectangle
 
-from quadrenderer.renderer import RealtimeQuadRenderer, RealtimeJuliaQuadRenderer, RealtimeCactusQuadRenderer, RealtimeGradientQuadRenderer, ScanRenderer
+from quadrenderer.renderer import RealtimeQuadRenderer, RealtimeJuliaQuadRenderer, RealtimeCactusQuadRenderer, RealtimeGradientQuadRenderer, RealtimeDeepQuadRenderer, RealtimeFormulaQuadRenderer, ScanRenderer, BoundaryTraceRenderer, RenderWorker, DeepCamera, saveIterations, loadIterations
+from quadrenderer import animation, formula, tilecache, stats
 
-import cv2
 import time
+import sys
 import os
 import re
+import threading
+
+def queued(method): # run a RendererWidget method on the render worker between its frames, which then shows the result and carries on rendering
+	def wrapper(self, *args, **kwargs):
+		def job():
+			method(self, *args, **kwargs)
+			self.worker.renderer = self.renderer
+		self.worker.submit(job)
+	return wrapper
+
 
 class RendererWidget(Widget):
 	def __init__(self, res = 512, AA = 4, maxIters = 1000, *args, **kwargs):
@@ -25,27 +39,57 @@ class RendererWidget(Widget):
 		self.rampValue = 1
 		self.fractal = 'mandelbrot'
 		self.texture = Texture.create(size=(self.res, self.res), bufferfmt="ubyte", colorfmt = "bgr")
+		self.viewMoves = [] # (x, y, zoom) moves of the view which the worker hasn't applied yet, see changeView
+		self.viewLock = threading.Lock()
 		self.juliacx = .3
 		self.juliacy = .5
+		self.formula = formula.Formula('z**2 + c')
+		self.smooth = False # continuous escape counts, see FullRenderer.smooth
+		self.ticksPerFrame = 8
+		self.frameBudget = 1/60 # the worker publishes an image about this often, and the quadtree renderers size their batches so about ticksPerFrame ticks fill it
+		self.firstFrame = None # seconds from process start to the first frame shown
+		self.uploaded = 0 # bytes uploaded to the texture so far
+		self.cache = tilecache.TileCache(directory = os.environ.get("QUADRENDERER_TILES", os.path.join(os.path.expanduser("~"), ".quadrenderer", "tiles"))) # so revisited views don't render again
 		with self.canvas:
 			Rectangle(texture=self.texture, pos=(0, 0), size=(self.res, self.res))
 		self.renderer = RealtimeQuadRenderer(res = self.res, AA = self.AA, maxIters = self.maxIters)
+		self.renderer.tickBudget = self.frameBudget/self.ticksPerFrame
+		self.renderer.cache = self.cache
+		tilecache.align(self.renderer.cam)
 		self.renderer.begin()
+		self.worker = RenderWorker(self.renderer, self.frameBudget) # renders off the UI thread, which only blits what it publishes
 		Clock.schedule_once(self.tick, 0)
 		#print(App.get_running_app().path)
 
 	def tick(self, dt):
-		for i in range(150):
-			if not self.renderer.tick():
-				break
-		if i != 0:
-			self.renderer.updateImage()
-			self.texture.blit_buffer(self.renderer.image.tostring(), bufferfmt="ubyte", colorfmt = "bgr")
-			self.canvas.ask_update()
+		frame = self.worker.take()
+		if frame is not None:
+			self.blit(*frame)
+			if self.firstFrame is None:
+				self.firstFrame = time.time() - precompile.start
+				print("First frame after " + str(round(self.firstFrame, 2)) + " seconds.")
 		Clock.schedule_once(self.tick, 0)
 
+	def blit(self, image, rects): # upload the changed (x, y, width, height) rectangles of image straight from its memory
+		if sum(width*height for x, y, width, height in rects) > self.res*self.res/2: # past this one upload beats many small ones
+			rects = [[0, 0, self.res, self.res]]
+		pixels = memoryview(image.reshape(-1))
+		with stats.timed("upload"):
+			for x, y, width, height in rects:
+				# each row of the rectangle is a full image row apart, which rowlength tells OpenGL, so the rectangle needs no copy
+				start = (y*self.res + x)*3
+				end = ((y + height - 1)*self.res + x + width)*3
+				self.texture.blit_buffer(pixels[start:end], size = (width, height), pos = (x, y), colorfmt = "bgr", bufferfmt = "ubyte", rowlength = self.res)
+		self.uploaded += sum(width*height*3 for x, y, width, height in rects)
+		if stats.enabled:
+			stats.add("uploaded bytes", sum(width*height*3 for x, y, width, height in rects))
+		self.canvas.ask_update()
+
+	@queued
 	def changeFractal(self, fractal):
 		color = self.renderer.colorProfile.profileName
+		if isinstance(self.renderer, RealtimeQuadRenderer):
+			self.renderer.cacheSamples()
 		if fractal == 'mandelbrot':
 			self.renderer = RealtimeQuadRenderer(res = self.res, AA = self.AA, maxIters = self.maxIters)
 		elif fractal == 'julia':
@@ -54,77 +98,158 @@ class RendererWidget(Widget):
 			self.renderer.cy = self.juliacy
 		elif fractal == 'cactus':
 			self.renderer = RealtimeCactusQuadRenderer(res = self.res, AA = self.AA, maxIters = self.maxIters)
+		elif fractal == 'deep':
+			self.renderer = RealtimeDeepQuadRenderer(res = self.res, AA = self.AA, maxIters = self.maxIters)
+		elif fractal == 'formula' or fractal == 'formulajulia':
+			self.renderer = RealtimeFormulaQuadRenderer(res = self.res, AA = self.AA, maxIters = self.maxIters)
+			self.renderer.formula = self.formula
+			self.renderer.julia = fractal == 'formulajulia'
+			self.renderer.cx = self.juliacx
+			self.renderer.cy = self.juliacy
 		elif fractal == 'gradient':
 			self.renderer = RealtimeGradientQuadRenderer(res = self.res, AA = self.AA, maxIters = self.maxIters)
 		elif fractal == 'scanline':
-			self.renderer = ScanRenderer(res = self.res, AA = self.AA, maxIters = self.maxIters)
+			self.renderer = ScanRenderer(res = self.res, AA = self.AA, maxIters = self.maxIters, progressive = True)
+			self.renderer.adaptive = True
+		elif fractal == 'boundary':
+			self.renderer = BoundaryTraceRenderer(res = self.res, AA = self.AA, maxIters = self.maxIters)
 		else:
 			raise(TypeError)
 		self.renderer.colorProfile.loadProfile(color)
 		self.renderer.colorProfile.multiple = self.rampValue
+		self.renderer.tickBudget = self.frameBudget/self.ticksPerFrame
+		self.smoothRenderer()
+		if isinstance(self.renderer, RealtimeQuadRenderer):
+			self.renderer.cache = self.cache
+			tilecache.align(self.renderer.cam)
 		self.renderer.begin()
 		self.fractal = fractal
 
+	def smoothRenderer(self): # apply the smooth setting to the renderer, which the boundary tracer ignores since its fills need whole iterations
+		self.renderer.smooth = self.smooth
+		if isinstance(self.renderer, ScanRenderer):
+			self.renderer.edgeThreshold = 1 if self.smooth else 0 # smooth counts differ a little between any neighbours, so only whole iteration jumps are edges
+
+	@queued
+	def changeSmooth(self, on):
+		self.smooth = on
+		self.smoothRenderer()
+		self.renderer.begin()
+
+	@queued
 	def changeColor(self, color):
 		self.renderer.colorProfile.loadProfile(color)
 		self.renderer.fullUpdateImage()
-		self.texture.blit_buffer(self.renderer.image.tostring(), bufferfmt="ubyte", colorfmt = "bgr")
-		self.canvas.ask_update()
 
+	@queued
 	def changeColorMode(self, mode):
 		self.renderer.colorSlice = mode
 		self.renderer.fullUpdateImage()
-		self.texture.blit_buffer(self.renderer.image.tostring(), bufferfmt="ubyte", colorfmt = "bgr")
-		self.canvas.ask_update()
 
-	def changeView(self, x, y, zoom):
-		zr = self.renderer.cam.zoom/zoom
-		self.renderer.cam.xPos -= x/self.renderer.cam.xRes*zr
-		self.renderer.cam.yPos += y/self.renderer.cam.yRes*zr
-		self.renderer.cam.zoom /= zoom
-		self.renderer.begin()
+	def changeView(self, x, y, zoom): # queue a move of the view for the worker, which applies the moves queued while it was busy together
+		with self.viewLock:
+			self.viewMoves.append((x, y, zoom))
+			if len(self.viewMoves) > 1: # the worker has yet to apply the earlier moves, and will apply this one with them
+				return
+		self.moveView()
+
+	@queued
+	def moveView(self):
+		with self.viewLock:
+			moves, self.viewMoves = self.viewMoves, []
+		old = (self.renderer.cam.xPos, self.renderer.cam.yPos, self.renderer.cam.zoom)
+		for x, y, zoom in moves:
+			if zoom == 1: # snap pans to whole pixels so the previous samples stay on the lattice and can be reused
+				x, y = round(x), round(y)
+			self.renderer.cam.move(x, y, zoom)
+			tilecache.align(self.renderer.cam) # zooms snap to the cache's levels, so zooming back out finds the samples rendered before
+		self.renderer.beginFrom(*old)
 
+	@queued
 	def changeRamp(self, value):
 		if value != self.rampValue:
 			self.rampValue = value
 			self.renderer.colorProfile.multiple = value
 			self.renderer.fullUpdateImage()
 
+	@queued
 	def changeJuliacx(self, value):
 		if value != self.juliacx:
 			self.juliacx = value
-			if self.fractal == 'julia':
+			if self.fractal in ('julia', 'formulajulia'):
 				self.renderer.cx = value
 				self.renderer.begin()
 
+	@queued
 	def changeJuliacy(self, value):
 		if value != self.juliacy:
 			self.juliacy = value
-			if self.fractal == 'julia':
+			if self.fractal in ('julia', 'formulajulia'):
 				self.renderer.cy = value
 				self.renderer.begin()
 
-	def changeMaxIters(self, text):
+	def changeFormula(self, text): # returns the formula in use, which is the old one if text isn't a valid formula
+		try:
+			newFormula = formula.Formula(text)
+			newFormula.compile()
+		except ValueError as e:
+			print(e)
+			return self.formula.expression
+		with self.worker:
+			self.formula = newFormula
+			if self.fractal in ('formula', 'formulajulia'):
+				self.renderer.formula = newFormula
+				self.renderer.begin()
+		return text
+
+	def changeMaxIters(self, text): # returns the text to show, while the worker applies the change
 		value = int(float(text))
+		self.setMaxIters(value)
+		return str(value)
+
+	@queued
+	def setMaxIters(self, value):
 		if value != self.maxIters:
 			self.maxIters = value
 			self.renderer.maxIters = value
 			self.renderer.begin()
 			self.changeRamp(self.rampValue)
-		return str(value)
+
+	def saveCache(self): # write the tile cache to disk, e.g. before quitting
+		with self.worker:
+			if isinstance(self.renderer, RealtimeQuadRenderer):
+				self.renderer.cacheSamples()
+			self.cache.flush()
 
 	def ensurePath(self, path):
 		if not os.path.exists(path):
 			os.makedirs(path)
 
+	@queued
 	def saveImage(self):
+		import cv2
 		self.ensurePath('screenshots/')
 		i = 0
 		while os.path.exists('screenshots/' + self.fractal + str(i) + '.png'):
 			i += 1
 		cv2.imwrite('screenshots/' + self.fractal + str(i) + '.png', self.renderer.image[::-1, :, ::-1])
 
-	def saveSettings(self):
+	@queued
+	def saveRender(self): # save the iteration buffer so the render can be restyled later without rendering it again
+		self.ensurePath('renders/')
+		i = 0
+		while os.path.exists('renders/' + self.fractal + str(i) + '.npz'):
+			i += 1
+		saveIterations(self.renderer, 'renders/' + self.fractal + str(i) + '.npz')
+
+	@queued
+	def loadRender(self, path):
+		loadIterations(self.renderer, path)
+		self.maxIters = self.renderer.maxIters
+		self.smooth = self.renderer.smooth
+
+	@queued
+	def saveSettings(self): # after the view changes queued before it
 		self.ensurePath('saves/')
 		i = 0
 		while os.path.exists('saves/'+self.fractal+str(i)+'.qr'):
@@ -140,10 +265,33 @@ class RendererWidget(Widget):
 		file.write(str(self.renderer.colorSlice) + '\n')
 		file.write(str(self.renderer.colorProfile.profileName) + '\n')
 		file.write(str(self.rampValue) + '\n')
+		file.write(self.formula.expression + '\n')
 		file.close()
 
-	def loadSettings(self):
-		self.ensurePath(App.get_running_app().path + '/saves/')
+	@queued
+	def loadSettings(self, path = None): # load a .qr file, by default the most recently saved one
+		if path is None:
+			self.ensurePath('saves/')
+			saves = [os.path.join('saves/', name) for name in os.listdir('saves/') if name.endswith('.qr')]
+			if not saves:
+				return
+			path = max(saves, key = os.path.getmtime)
+		settings = animation.loadSettings(path)
+		self.maxIters = settings['maxIters']
+		self.juliacx = settings['juliacx']
+		self.juliacy = settings['juliacy']
+		self.rampValue = settings['rampValue']
+		self.formula = formula.Formula(settings['formula'])
+		self.changeFractal(settings['fractal'])
+		self.renderer.colorProfile.loadProfile(settings['profileName'])
+		self.renderer.colorSlice = settings['colorSlice']
+		if isinstance(self.renderer.cam, DeepCamera):
+			self.renderer.cam.xPos, self.renderer.cam.yPos = settings['xPos'], settings['yPos']
+		else:
+			self.renderer.cam.xPos, self.renderer.cam.yPos = float(settings['xPos']), float(settings['yPos'])
+		self.renderer.cam.zoom = settings['zoom']
+		tilecache.align(self.renderer.cam)
+		self.renderer.begin()
 
 
 class RenderScatter(Scatter):
@@ -153,11 +301,12 @@ class RenderScatter(Scatter):
 
 	def on_touch_down(self, touch):
 		if touch.is_mouse_scrolling:
-			p = self.renderer.res*.05
-			if touch.button == 'scrolldown':
-				self.renderer.changeView(-p, -p, 1.1)
-			elif touch.button == 'scrollup':
-				self.renderer.changeView(p, p, .9)
+			zoom = 2**(1/tilecache.zoomSteps) # one cache zoom level per scroll step
+			if touch.button == 'scrollup':
+				zoom = 1/zoom
+			if touch.button in ('scrolldown', 'scrollup'):
+				p = self.renderer.res*(zoom - 1)/2 # keeps the center in place
+				self.renderer.changeView(-p, -p, zoom)
 		super().on_touch_down(touch)
 
 	def on_touch_up(self, touch):
@@ -189,6 +338,30 @@ class RootWidget(FloatLayout):
 		self.renderer = RendererWidget(res = 1024, AA = 8, maxIters = 1000)
 		self.scatter.set_renderer(self.renderer)
 		self.add_widget(self.scatter, index = 3)
+		self.statsLabel = Label(size_hint = (None, None), size = (420, 360), pos = (10, 10), font_name = 'RobotoMono-Regular', font_size = 12,
+			halign = 'left', valign = 'bottom', opacity = 0)
+		self.statsLabel.text_size = self.statsLabel.size
+		self.add_widget(self.statsLabel)
+		self.statsEvent = None
+		if stats.enabled: # e.g. from QUADRENDERER_STATS=1
+			self.toggleStats(True)
+
+	def toggleStats(self, on): # show or hide the instrumentation overlay, which counts only while shown
+		stats.enable(on)
+		if self.statsEvent is not None:
+			self.statsEvent.cancel()
+			self.statsEvent = None
+		self.statsLabel.opacity = 1 if on else 0
+		self.statsLabel.text = ''
+		if on:
+			stats.reset()
+			self.statsBefore, self.statsTime = stats.snapshot(), time.time()
+			self.statsEvent = Clock.schedule_interval(self.showStats, .5)
+
+	def showStats(self, dt): # the rate of every counter and timer over the last interval
+		now = time.time()
+		self.statsLabel.text = stats.report(self.statsBefore, now - self.statsTime)
+		self.statsBefore, self.statsTime = stats.snapshot(), now
 
 
 class QuadRendererApp(App):
@@ -200,6 +373,12 @@ class QuadRendererApp(App):
 	def Quit(self):
 		self.stop()
 
+	def on_stop(self):
+		self.root.renderer.saveCache()
+
 
 if __name__=="__main__":
+	if "precompile" in sys.argv: # compile every kernel into numba's cache and exit, e.g. when building a release
+		precompile.warmup()
+		sys.exit()
 	QuadRendererApp().run()
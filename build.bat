@@ -1,6 +1,9 @@
 mkdir C:\Users\%USERNAME%\Documents\QuadtreeRendererDeploy
 cd C:\Users\%USERNAME%\Documents\QuadtreeRendererDeploy
-python -m PyInstaller --name quadrenderer C:\Users\%USERNAME%\Documents\QuadtreeRenderer\application.py
+python -m PyInstaller --name quadrenderer --add-data C:\Users\%USERNAME%\Documents\QuadtreeRenderer\quadrenderer;quadrenderer C:\Users\%USERNAME%\Documents\QuadtreeRenderer\application.py
 copy C:\Users\%USERNAME%\Documents\QuadtreeRenderer\dist\quadrenderer\quadrenderer.kv quadrenderer.kv
 robocopy C:\Users\%USERNAME%\Documents\QuadtreeRenderer\dist\quadrenderer\color_profiles\ \\color_profiles\
+REM numba needs the kernel sources on disk to key its cache, hence --add-data above. Compile every kernel once into the
+REM build's numba_cache folder so the packaged app doesn't JIT on launch
+dist\quadrenderer\quadrenderer.exe precompile
 PAUSE
\ No newline at end of file
@@ -0,0 +1,257 @@
+import argparse
+import json
+import math
+import os
+import queue
+import sys
+import threading
+import time
+from fractions import Fraction
+import numpy as np
+sys.path.append("..")
+from quadrenderer import formula
+from quadrenderer.renderer import FullRenderer, JuliaFullRenderer, CactusFullRenderer, GradientRenderer, DeepFullRenderer, FormulaFullRenderer, DeepCamera, projectSamples
+
+settingNames = ('xPos', 'yPos', 'zoom', 'maxIters', 'juliacx', 'juliacy', 'fractal', 'colorSlice', 'profileName', 'rampValue', 'formula') # the lines of a .qr file, in order
+
+def loadSettings(path): # read a .qr file written by RendererWidget.saveSettings
+	with open(path) as file:
+		lines = [line.strip() for line in file]
+	settings = dict(zip(settingNames, lines))
+	settings['xPos'] = Fraction(settings['xPos']) # positions stay exact so deep zoom keyframes survive interpolation
+	settings['yPos'] = Fraction(settings['yPos'])
+	settings['zoom'] = float(settings['zoom'])
+	settings['maxIters'] = int(settings['maxIters'])
+	settings['juliacx'] = float(settings['juliacx'])
+	settings['juliacy'] = float(settings['juliacy'])
+	settings['colorSlice'] = int(settings['colorSlice'])
+	settings['rampValue'] = float(settings['rampValue'])
+	settings.setdefault('formula', 'z**2 + c') # older saves have no formula line
+	return settings
+
+def interpolate(a, b, t): # the settings a fraction t of the way from keyframe a to keyframe b
+	zoom = math.exp(math.log(a['zoom'])*(1-t) + math.log(b['zoom'])*t) # zoom at a constant rate
+	if a['zoom'] == b['zoom']:
+		u = t
+	else:
+		u = (zoom - a['zoom'])/(b['zoom'] - a['zoom']) # move the center in step with the zoom, so the view doesn't drift
+	u = Fraction(u)
+	# .qr positions are the view's lower left corner, so interpolate the centers and convert back
+	xCenter = a['xPos'] + Fraction(a['zoom'])/2 + (b['xPos'] + Fraction(b['zoom'])/2 - a['xPos'] - Fraction(a['zoom'])/2)*u
+	yCenter = a['yPos'] - Fraction(a['zoom'])/2 + (b['yPos'] - Fraction(b['zoom'])/2 - a['yPos'] + Fraction(a['zoom'])/2)*u
+	settings = dict(a)
+	settings['xPos'] = xCenter - Fraction(zoom)/2
+	settings['yPos'] = yCenter + Fraction(zoom)/2
+	settings['zoom'] = zoom
+	settings['maxIters'] = round(a['maxIters']*(1-t) + b['maxIters']*t)
+	settings['juliacx'] = a['juliacx']*(1-t) + b['juliacx']*t
+	settings['juliacy'] = a['juliacy']*(1-t) + b['juliacy']*t
+	settings['rampValue'] = a['rampValue']*(1-t) + b['rampValue']*t
+	return settings # the fractal, formula, color profile and color mode switch at the next keyframe
+
+def frameSettings(keyframes, frame, frames): # the settings of a frame, with the keyframes spread evenly over the sequence
+	if len(keyframes) == 1 or frames == 1:
+		return keyframes[0]
+	s = frame*(len(keyframes)-1)/(frames-1)
+	key = min(int(s), len(keyframes)-2)
+	return interpolate(keyframes[key], keyframes[key+1], s-key)
+
+def makeRenderer(settings, res, samples, workers, adaptive = False): # a FullRenderer for a frame's settings, taking samples AA samples per pixel, only on edges if adaptive
+	AA = samples+1 # FullRenderer takes AA-1 samples
+	fractal = settings['fractal']
+	if fractal == 'julia':
+		renderer = JuliaFullRenderer(res, res, AA, settings['maxIters'], settings['juliacx'], settings['juliacy'], workers = workers)
+	elif fractal == 'cactus':
+		renderer = CactusFullRenderer(res, res, AA, settings['maxIters'], workers = workers)
+	elif fractal == 'gradient':
+		renderer = GradientRenderer(res, res, AA, settings['maxIters'], workers = workers)
+	elif fractal == 'formula' or fractal == 'formulajulia':
+		renderer = FormulaFullRenderer(res, res, AA, settings['maxIters'], workers = workers)
+		renderer.formula = formula.Formula(settings['formula'])
+		renderer.julia = fractal == 'formulajulia'
+		renderer.cx, renderer.cy = settings['juliacx'], settings['juliacy']
+	elif fractal == 'deep':
+		renderer = DeepFullRenderer(res, res, AA, settings['maxIters'], workers = workers)
+	else: # mandelbrot, and scanline and boundary which render the Mandelbrot set
+		renderer = FullRenderer(res, res, AA, settings['maxIters'], workers = workers)
+	if isinstance(renderer.cam, DeepCamera):
+		renderer.cam.xPos, renderer.cam.yPos = settings['xPos'], settings['yPos']
+	else:
+		renderer.cam.xPos, renderer.cam.yPos = float(settings['xPos']), float(settings['yPos'])
+	renderer.cam.zoom = settings['zoom']
+	renderer.colorProfile.loadProfile(settings['profileName'])
+	renderer.colorProfile.multiple = settings['rampValue']
+	renderer.colorSlice = settings['colorSlice']
+	renderer.adaptive = adaptive
+	return renderer
+
+class FrameWriter(threading.Thread): # encodes and writes frames on a separate thread, so rendering the next frame overlaps with writing the last
+	def __init__(self, maxQueued = 4):
+		super().__init__(daemon = True)
+		self.frames = queue.Queue(maxQueued) # bounded, so rendering waits rather than piling up frames in memory
+		self.error = None # the first exception writing a frame, raised on the rendering thread by write or check
+		self.start()
+
+	def run(self):
+		import cv2
+		while True:
+			item = self.frames.get()
+			if item is None:
+				break
+			if self.error is not None:
+				continue # keep emptying the queue, so write never blocks on a writer that has failed
+			path, image = item
+			temp = path + ".tmp.png"
+			try:
+				if not cv2.imwrite(temp, image):
+					raise IOError("could not write " + temp)
+				os.replace(temp, path) # a frame only appears once it is complete, so resuming never skips a half written file
+			except Exception as e:
+				self.error = e
+
+	def check(self): # raise the error which stopped the writer, if any
+		if self.error is not None:
+			raise self.error
+
+	def write(self, path, image):
+		self.check()
+		self.frames.put((path, image))
+
+	def close(self):
+		self.frames.put(None)
+		self.join()
+
+def animationSettings(keyframes, frames, res, samples, adaptive, coherent): # the parts of the manifest that must match to resume an animation
+	return {"keyframes": [{name: str(value) for name, value in settings.items()} for settings in keyframes], "frames": frames, "res": res,
+		"samples": samples, "adaptive": adaptive, "coherent": coherent}
+
+def checkManifest(outDir, expected): # make sure the frames already in outDir belong to this animation, then record its settings there
+	path = os.path.join(outDir, "manifest.json")
+	if os.path.exists(path):
+		with open(path) as file:
+			manifest = json.load(file)
+		for key, value in expected.items():
+			if manifest.get(key) != value:
+				raise ValueError("the animation in " + outDir + " was started with different " + key)
+		return
+	if any(name.startswith("frame") and name.endswith(".png") for name in os.listdir(outDir)):
+		raise ValueError(outDir + " has frames from an animation without a manifest, so they can't be resumed")
+	with open(path + ".tmp", "w") as file:
+		json.dump(expected, file)
+	os.replace(path + ".tmp", path)
+
+def framePath(outDir, frame):
+	return os.path.join(outDir, "frame" + str(frame).zfill(5) + ".png")
+
+class CoherenceStats(): # how much work temporal coherence saved, and how far it strayed from full renders
+	def __init__(self):
+		self.frames = 0 # frames predicted from the frame before, which skips those rendered in full since prediction stopped paying off
+		self.pixels = 0 # pixels in those frames
+		self.rendered = 0 # pixels actually rendered for them, counting sparse checks
+		self.verified = 0
+		self.coherentTime = 0
+		self.fullTime = 0
+		self.wrongPixels = 0
+		self.verifiedPixels = 0
+		self.maxError = 0
+
+	def add(self, pixels, rendered):
+		self.frames += 1
+		self.pixels += pixels
+		self.rendered += rendered
+
+	def verify(self, coherent, full, coherentTime, fullTime): # compare a predicted frame's iteration buffer with a full render of it
+		error = np.abs(coherent - full)
+		self.verified += 1
+		self.coherentTime += coherentTime
+		self.fullTime += fullTime
+		self.wrongPixels += np.count_nonzero(error)
+		self.verifiedPixels += error.size
+		self.maxError = max(self.maxError, float(error.max()))
+
+	def report(self):
+		if self.frames == 0:
+			return "No frames were predicted."
+		lines = [str(self.frames) + " predicted frames rendered " + str(round(100*self.rendered/self.pixels, 1)) + "% of their pixels"]
+		if self.verified:
+			lines.append(str(self.verified) + " verified frames: " + str(round(self.fullTime/self.coherentTime, 2)) + "x faster than full renders, "
+				+ str(self.wrongPixels) + " wrong pixels (" + str(round(100*self.wrongPixels/self.verifiedPixels, 4)) + "%), max error " + str(round(self.maxError, 2)) + " iterations")
+		return "\n".join(lines)
+
+def renderAnimation(keyframes, frames, outDir, res = 512, samples = 4, workers = None, coherent = False, verifyStride = 10, tileSize = 32, adaptive = False): # render every frame not already on disk
+	# with coherent set each frame is predicted from the one before: tiles of tileSize predicted uniform are only checked sparsely,
+	# and every verifyStride-th frame is also fully rendered to measure the error and to stop it carrying forward. Frames whose
+	# uniform tiles are predicted to save little (e.g. cheap exterior, or few of them) are rendered in full, see renderCoherent, and
+	# while the last verified frame was slower predicted than in full, only verified frames are predicted
+	if coherent and adaptive:
+		raise ValueError("coherent rendering takes every AA sample of the pixels it renders, so it can't be combined with adaptive anti-aliasing")
+	if not os.path.exists(outDir):
+		os.makedirs(outDir)
+	checkManifest(outDir, animationSettings(keyframes, frames, res, samples, adaptive, coherent))
+	writer = FrameWriter()
+	stats = CoherenceStats()
+	previous = None
+	predicting = True # until a verified frame renders slower predicted than in full, after which only verified frames try again
+	try:
+		for frame in range(frames):
+			path = framePath(outDir, frame)
+			if os.path.exists(path): # resume a partially finished sequence
+				previous = None
+				continue
+			t = time.time()
+			renderer = makeRenderer(frameSettings(keyframes, frame, frames), res, samples, workers, adaptive)
+			verifying = verifyStride and frame % verifyStride == 0
+			if coherent and previous is not None and type(previous) is type(renderer) and (predicting or verifying):
+				start = time.time()
+				renderer.engine.predictedTileSize = tileSize
+				renderer.render(projectSamples(previous.total, previous.cam, renderer.cam))
+				stats.add(res*res, renderer.engine.rendered)
+				if verifying:
+					coherentTime = time.time()-start
+					predicted = renderer.iterations
+					start = time.time()
+					renderer.render()
+					fullTime = time.time()-start
+					stats.verify(predicted, renderer.iterations, coherentTime, fullTime)
+					predicting = coherentTime < fullTime
+			else:
+				renderer.render()
+			writer.write(path, renderer.colorImage()[::-1, :, ::-1]) # flipped like RendererWidget.saveImage
+			previous = renderer
+			print("Frame " + str(frame+1) + "/" + str(frames) + " took " + str(round(time.time()-t, 2)) + "s")
+	finally:
+		writer.close()
+	writer.check()
+	if coherent:
+		print(stats.report())
+	return stats
+
+def writeVideo(outDir, frames, path, fps = 30): # assemble the finished frames into a video, reading one frame at a time
+	import cv2
+	video = None
+	for frame in range(frames):
+		image = cv2.imread(framePath(outDir, frame))
+		if video is None:
+			video = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (image.shape[1], image.shape[0]))
+		video.write(image)
+	video.release()
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description = "Render an animation between .qr keyframes saved by the application.")
+	parser.add_argument("keyframes", nargs = "+", help = ".qr files, in order")
+	parser.add_argument("--frames", type = int, default = 60)
+	parser.add_argument("--res", type = int, default = 512)
+	parser.add_argument("--samples", type = int, default = 4, choices = range(1, 8), metavar = "{1-7}", help = "anti-aliasing samples per pixel, at most 7 as FullRenderer takes")
+	parser.add_argument("--workers", type = int, default = None, help = "render threads, defaults to one per core")
+	parser.add_argument("--out", default = "animation")
+	parser.add_argument("--adaptive", action = "store_true", help = "anti-alias only the pixels on edges")
+	parser.add_argument("--coherent", action = "store_true", help = "predict each frame from the one before, checking stable regions sparsely. This pays off zooming into detail with much of the set in view, and otherwise falls back to full renders")
+	parser.add_argument("--verify", type = int, default = 10, help = "with --coherent, also fully render every this many frames to measure the error (0 to never)")
+	parser.add_argument("--video", default = None, help = "also write the frames to this .mp4 file")
+	parser.add_argument("--fps", type = int, default = 30)
+	args = parser.parse_args()
+	if args.coherent and args.adaptive:
+		parser.error("--coherent can't be combined with --adaptive")
+	renderAnimation([loadSettings(path) for path in args.keyframes], args.frames, args.out, args.res, args.samples, args.workers, args.coherent, args.verify, adaptive = args.adaptive)
+	if args.video:
+		writeVideo(args.out, args.frames, args.video, args.fps)
@@ -0,0 +1,281 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import numpy as np
+sys.path.append("..")
+from quadrenderer import lattice, profile, renderer, stats
+from quadrenderer.renderer import Camera, DeepCamera
+
+# Every engine and fractal renders the same fixed views, so results from different commits can be compared case by case.
+# JIT compilation (or loading kernels from numba's cache) is timed separately, by rendering each case once at a tiny resolution first.
+
+engines = { # engine -> fractal -> renderer class
+	"quad": {"mandelbrot": renderer.RealtimeQuadRenderer, "julia": renderer.RealtimeJuliaQuadRenderer, "cactus": renderer.RealtimeCactusQuadRenderer,
+		"deep": renderer.RealtimeDeepQuadRenderer, "formula": renderer.RealtimeFormulaQuadRenderer},
+	"scan": {"mandelbrot": renderer.ScanRenderer, "julia": renderer.JuliaScanRenderer, "cactus": renderer.CactusScanRenderer, "formula": renderer.FormulaScanRenderer},
+	"boundary": {"mandelbrot": renderer.BoundaryTraceRenderer},
+	"full": {"mandelbrot": renderer.FullRenderer, "julia": renderer.JuliaFullRenderer, "cactus": renderer.CactusFullRenderer,
+		"deep": renderer.DeepFullRenderer, "formula": renderer.FormulaFullRenderer},
+}
+
+views = { # fractal -> view -> center x, center y and zoom
+	"mandelbrot": renderer.viewpoints,
+	"julia": {"full": (0, 0, 3), "spiral": (.3, .2, .1)},
+	"cactus": {"full": (0, 0, 3)},
+	"deep": {"spiral": ("-0.743643887037158704752191506114774", "0.131825904205311970493132056385139", 1e-6)}, # shallow enough to escape within a few thousand iterations
+	"formula": {"full": (-.5, 0, 3)}, # the default formula, z**2 + c
+}
+smoothFractals = ("mandelbrot", "julia", "cactus") # which have smooth kernels, see FullRenderer.smooth
+tickBudget = 1/60/8 # as RendererWidget sets it, so the realtime engines batch their ticks the same way
+
+
+class PeakMemory(threading.Thread): # polls the process's resident memory while rendering, since the OS only reports the peak of the whole process
+	def __init__(self, interval = .005):
+		super().__init__(daemon = True)
+		self.interval = interval
+		self.peak = profile.get_process_memory()[0]
+		self.done = threading.Event()
+
+	def run(self):
+		while not self.done.wait(self.interval):
+			self.peak = max(self.peak, profile.get_process_memory()[0])
+
+	def __enter__(self):
+		self.start()
+		return self
+
+	def __exit__(self, *exc):
+		self.done.set()
+		self.join()
+		self.peak = max(self.peak, profile.get_process_memory()[0])
+
+
+def makeRenderer(engine, fractal, view, res, AA, maxIters, precision = "default", smooth = False): # a renderer for one case, looking at its view
+	cls = engines[engine][fractal]
+	if engine == "full":
+		r = cls(res, res, AA, maxIters, workers = 1) # one worker, so results don't depend on the machine's core count
+	else:
+		r = cls(res = res, AA = AA, maxIters = maxIters)
+		r.tickBudget = tickBudget
+	if precision != "default": # otherwise the renderer's own, float64 for the full renderer and auto for the rest
+		r.precision = precision
+	if smooth:
+		r.smooth = True
+		if isinstance(r, renderer.ScanRenderer):
+			r.edgeThreshold = 1 # as the application sets it, since smooth counts differ a little between any neighbours
+	x, y, zoom = views[fractal][view]
+	r.cam = (DeepCamera if isinstance(r.cam, DeepCamera) else Camera)(res, res, x, y, zoom)
+	return r
+
+def run(r): # render to completion, returning the ticks taken (0 for the full renderer), the samples evaluated and the kernel calls
+	counts = [0, 0]
+	renderPoints = r.renderPoints
+	def counted(coords): # every engine renders through renderPoints, so counting there sees every sample
+		counts[0] += len(coords[0])
+		counts[1] += 1
+		return renderPoints(coords)
+	r.renderPoints = counted
+	ticks = 0
+	if isinstance(r, renderer.FullRenderer):
+		with contextlib.redirect_stdout(io.StringIO()): # render prints its own timing
+			r.render()
+	else:
+		r.begin()
+		while r.tick():
+			ticks += 1
+		r.updateImage()
+	del r.renderPoints
+	return ticks, counts[0], counts[1]
+
+def reference(fractal, view, res, maxIters, cache = {}): # the colors of a float64 smooth render at 7 samples, the most FullRenderer takes and the closest this can get to the exact image
+	if (fractal, view, res, maxIters) not in cache:
+		r = makeRenderer("full", fractal, view, res, 8, maxIters, "float64", True) # FullRenderer takes AA-1 samples
+		run(r)
+		cache[fractal, view, res, maxIters] = r.colorImage().astype(np.int16)
+	return cache[fractal, view, res, maxIters]
+
+def measure(engine, fractal, view, res, AA, maxIters, precision = "default", smooth = False, repeat = 3, withStats = False, accuracy = False): # time one case, after rendering it once at a tiny resolution to compile its kernels
+	t = time.perf_counter()
+	run(makeRenderer(engine, fractal, view, 16, AA, maxIters, precision, smooth))
+	warmup = time.perf_counter() - t
+	times = []
+	peak = 0
+	for i in range(repeat):
+		r = makeRenderer(engine, fractal, view, res, AA, maxIters, precision, smooth)
+		with PeakMemory() as memory:
+			t = time.perf_counter()
+			ticks, samples, calls = run(r)
+			times.append(time.perf_counter() - t)
+		peak = max(peak, memory.peak)
+	best = min(times)
+	result = {"engine": engine, "fractal": fractal, "view": view, "res": res, "AA": AA, "maxIters": maxIters, "precision": precision, "smooth": smooth,
+		"warmup": warmup, "times": times, "best": best, "median": sorted(times)[len(times)//2],
+		"ticks": ticks, "samples": samples, "kernelCalls": calls, "samplesPerSecond": samples/best, "peakRSS": peak}
+	if accuracy and engine == "full" and renderer.coordinateType(r) is not np.float64: # only the full renderer keeps an iteration count per pixel to compare
+		exact = makeRenderer(engine, fractal, view, res, AA, maxIters, "float64", smooth)
+		run(exact)
+		result["pixelsDiffer"] = np.count_nonzero(r.iterations != exact.iterations)/r.iterations.size
+	if accuracy and engine == "full" and fractal in smoothFractals: # so smooth renders at fewer samples can be weighed against whole iterations at more
+		result["colorError"] = float(np.abs(r.colorImage().astype(np.int16) - reference(fractal, view, res, maxIters)).mean())
+	del r
+	if withStats: # in one more render, so the instrumentation doesn't touch the timings
+		stats.reset()
+		stats.enable()
+		run(makeRenderer(engine, fractal, view, res, AA, maxIters, precision, smooth))
+		stats.enable(False)
+		result["stats"] = stats.snapshot()
+	return result
+
+def cases(engineNames, fractalNames, resolutions, AAs, iterations, precisions = ("default",), smooths = (False,)): # every combination which exists, in a fixed order
+	for engine in engineNames:
+		for fractal in fractalNames:
+			if fractal not in engines[engine]:
+				continue
+			for view in views[fractal]:
+				for res in resolutions:
+					for AA in AAs:
+						for maxIters in iterations:
+							for precision in precisions:
+								if precision in ("auto", "float32") and not engines[engine][fractal].float32Kernels: # these only have float64 kernels
+									continue
+								for smooth in smooths:
+									if smooth and (fractal not in smoothFractals or engine == "boundary"): # the boundary tracer's fills need whole iterations
+										continue
+									yield engine, fractal, view, res, AA, maxIters, precision, smooth
+
+def environment(): # what the results depend on besides the code
+	import numba
+	import numpy
+	try:
+		commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output = True, text = True, cwd = os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+	except OSError:
+		commit = ""
+	return {"commit": commit, "time": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(), "numpy": numpy.__version__,
+		"numba": numba.__version__, "platform": platform.platform(), "cpus": os.cpu_count()}
+
+def key(result): # results from before a dimension was added ran at its default
+	return tuple(result[name] for name in ("engine", "fractal", "view", "res", "AA", "maxIters")) + (result.get("precision", "default"), result.get("smooth", False))
+
+def compare(results, baseline, threshold = .1): # print each case's change in best time against a baseline run, returning the cases which slowed by more than threshold
+	old = {key(result): result for result in baseline["results"]}
+	regressions = []
+	for result in results:
+		before = old.get(key(result))
+		if before is None:
+			continue
+		change = result["best"]/before["best"] - 1
+		flag = ""
+		if change > threshold:
+			flag = "  REGRESSION"
+			regressions.append(result)
+		elif result["samples"] != before["samples"]:
+			flag = "  samples " + str(before["samples"]) + " -> " + str(result["samples"])
+		elif "pixelsDiffer" in result and "pixelsDiffer" in before and result["pixelsDiffer"] != before["pixelsDiffer"]:
+			flag = "  pixels differing from float64 {:.2%} -> {:.2%}".format(before["pixelsDiffer"], result["pixelsDiffer"])
+		elif "colorError" in result and "colorError" in before and abs(result["colorError"] - before["colorError"]) > .01:
+			flag = "  color error {:.2f} -> {:.2f}".format(before["colorError"], result["colorError"])
+		print("{:<62} {:>8.3f}s -> {:>8.3f}s {:>+7.1%}{}".format(" ".join(str(part) for part in key(result)), before["best"], result["best"], change, flag))
+	return regressions
+
+# One-off comparisons, which measure a setting against its alternative rather than the code against an earlier commit.
+
+def scaling(res = 1024, AA = 8, maxIters = 1000): # time a full render with 1 to N worker threads
+	serial = None
+	for workers in range(1, os.cpu_count()+1):
+		r = renderer.FullRenderer(res, res, AA = AA, maxIters = maxIters, workers = workers)
+		r.renderBlock(0, 0, 1, 1) # compile the kernels before timing
+		t = time.perf_counter()
+		run(r)
+		elapsed = time.perf_counter() - t
+		serial = serial or elapsed
+		print("Render time with " + str(workers) + " worker(s) was " + str(round(elapsed, 2)) + "s (" + str(round(serial/elapsed, 2)) + "x)")
+
+def interior(res = 512, AA = 2, maxIters = 10000): # time the Mandelbrot kernels with and without the interior checks at each standard view
+	for name in views["mandelbrot"]:
+		times = []
+		for periodicity in (False, True):
+			r = makeRenderer("full", "mandelbrot", name, res, AA, maxIters)
+			r.periodicity = periodicity
+			r.renderBlock(0, 0, 1, 1) # compile the kernels before timing
+			t = time.perf_counter()
+			run(r)
+			times.append(time.perf_counter() - t)
+		print("Render time at " + name + " was " + str(round(times[0], 2)) + "s unchecked, " + str(round(times[1], 2)) + "s checked (" + str(round(times[0]/times[1], 1)) + "x)")
+
+def cornerReference(r): # what a quadtree renderer would show if it split every quad down to single pixels, each the mean of its own pattern samples
+	ys, xs = np.mgrid[0:r.res, 0:r.res]
+	px, py = lattice.quadPoints(xs.ravel(), ys.ravel(), np.ones(xs.size, dtype = np.int64), renderer.samplePattern[:r.AA+3])
+	return r.renderLattice(px, py).reshape(xs.size, -1).mean(axis = 1).reshape(r.res, r.res).astype(np.float32)
+
+def boundary(res = 512, maxIters = 1000): # compare the boundary tracer and the quadtree against exhaustive renders sampled like each of them, at each standard view
+	# the tracer samples pixel centers, so its reference is a per-pixel render. The quadtree samples its quads' corners on the pixel lattice
+	# and shows each quad's mean, so its reference is every pixel's own corners
+	for engine in ("boundary", "quad"):
+		run(makeRenderer(engine, "mandelbrot", "full", 16, 1, 10)) # compile the kernels before timing
+	for name in views["mandelbrot"]:
+		full = makeRenderer("full", "mandelbrot", name, res, 1, maxIters)
+		t = time.perf_counter()
+		references = {"boundary": full.engine.render([(.5, .5)])}
+		results = ["per-pixel " + str(round(time.perf_counter() - t, 2)) + "s"]
+		for engine in ("boundary", "quad"):
+			r = makeRenderer(engine, "mandelbrot", name, res, 1, maxIters) # the quadtree's smallest pattern samples each quad's 4 corners
+			r.precision = "float64" # as the references, so only tracing and subdividing can make pixels differ
+			t = time.perf_counter()
+			ticks, samples, calls = run(r)
+			elapsed = time.perf_counter() - t
+			if engine == "quad":
+				references["quad"] = cornerReference(r)
+			wrong = np.count_nonzero(r.iterations != references[engine])/r.iterations.size
+			results.append(engine + " " + str(round(elapsed, 2)) + "s, " + str(round(samples/r.iterations.size*100)) + "% of the samples, " + str(round(wrong*100, 2)) + "% of pixels differ")
+		print(name + ": " + "; ".join(results))
+
+studies = {"scaling": scaling, "interior": interior, "boundary": boundary}
+
+def main(argv = None):
+	parser = argparse.ArgumentParser(description = "Benchmark every renderer at fixed views, writing JSON results which can be compared between commits.")
+	parser.add_argument("--engines", nargs = "+", default = list(engines), choices = list(engines))
+	parser.add_argument("--fractals", nargs = "+", default = list(views), choices = list(views))
+	parser.add_argument("--res", nargs = "+", type = int, default = [256])
+	parser.add_argument("--aa", nargs = "+", type = int, default = [4], help = "the AA setting passed to each renderer, as the application does")
+	parser.add_argument("--iters", nargs = "+", type = int, default = [1000])
+	parser.add_argument("--precision", nargs = "+", default = ["default"], choices = ["default", "auto", "float32", "float64"],
+		help = "the kernels' precision, see coordinateType in renderer.py. The default is each renderer's own")
+	parser.add_argument("--smooth", nargs = "+", default = ["off"], choices = ["off", "on"], help = "whole iteration counts, continuous escape counts or both")
+	parser.add_argument("--repeat", type = int, default = 3, help = "timed renders of each case, of which the best is compared")
+	parser.add_argument("--out", default = "benchmark.json")
+	parser.add_argument("--compare", help = "a results file from an earlier run to compare against")
+	parser.add_argument("--stats", action = "store_true", help = "also record the instrumentation counters of each case, see stats.py")
+	parser.add_argument("--accuracy", action = "store_true", help = "also record, for full renders, the fraction of pixels which differ from float64 when iterating in float32, and the mean color error against a smooth render at 7 samples")
+	parser.add_argument("--threshold", type = float, default = .1, help = "the slowdown counted as a regression, as a fraction")
+	parser.add_argument("--study", choices = list(studies), help = "run one of the one-off comparisons instead, at its own settings")
+	args = parser.parse_args(argv)
+	if args.study:
+		studies[args.study]()
+		return 0
+	results = []
+	for case in cases(args.engines, args.fractals, args.res, args.aa, args.iters, args.precision, [smooth == "on" for smooth in args.smooth]):
+		result = measure(*case, repeat = args.repeat, withStats = args.stats, accuracy = args.accuracy)
+		results.append(result)
+		print("{:<62} best {:>8.3f}s, warm-up {:>6.2f}s, {:>6} ticks, {:>9} samples ({:.2f} M/s), peak RSS {}{}{}".format(" ".join(str(part) for part in case),
+			result["best"], result["warmup"], result["ticks"], result["samples"], result["samplesPerSecond"]/1e6, profile.format_bytes(result["peakRSS"]),
+			", {:.2%} of pixels differ".format(result["pixelsDiffer"]) if "pixelsDiffer" in result else "", ", color error {:.2f}".format(result["colorError"]) if "colorError" in result else ""))
+	with open(args.out + ".tmp", "w") as file:
+		json.dump({"environment": environment(), "results": results}, file, indent = 1)
+	os.replace(args.out + ".tmp", args.out)
+	if args.compare:
+		with open(args.compare) as file:
+			regressions = compare(results, json.load(file), args.threshold)
+		if regressions:
+			print(str(len(regressions)) + " case(s) slowed by more than " + str(round(args.threshold*100)) + "%")
+			return 1
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
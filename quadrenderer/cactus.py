@@ -1,10 +1,16 @@
+import numpy as np
 from numba import jit
+from quadrenderer.mandelbrot import smoothBailout, smoothCounts
 
 @jit(cache = True)
-def render(zx, zy, maxIter = 100):
+def render(zx, zy, maxIter = 100, periodicity = False):
 	iters = 0
 	x = zx
 	y = zy
+	checkX = x # Brent style cycle detection: compare against a saved point, saving a new one at doubling intervals
+	checkY = y
+	period = 0
+	limit = 2
 	while True:
 		iters += 1
 		# Square the x and y components BEFORE checking for divergence
@@ -14,5 +20,96 @@ def render(zx, zy, maxIter = 100):
 			return iters # Return the number of iterations if this pixel diverges
 		# Finish the required math for this iteration if the pixel has not diverged yet
 		x, y = (x2 - 3*y2 + zx - 1)*x - y*zy - zx, (3*x2 - y2 + zx - 1)*y + x*zy - zy
+		if periodicity:
+			if x == checkX and y == checkY: # the orbit has repeated exactly, so it will cycle forever without diverging
+				return 0
+			period += 1
+			if period == limit:
+				checkX = x
+				checkY = y
+				period = 0
+				limit *= 2
 		if iters >= maxIter:
 			return 0 # return 0 if the pixel does not diverge
+
+
+lanes = 16 # points iterated side by side, which LLVM turns into SIMD instructions
+steps = 8 # iterations between refilling lanes whose points have finished
+
+@jit(cache = True, nogil = True)
+def iterate(zx, zy, maxIter, periodicity, escape, out, radius): # the lanes behind renderArray and renderSmoothArray, storing each point's count in out and its |z|^2 on escaping in radius
+	# the same lanes as mandelbrot.renderArray, running render's loop; float64 results are identical to render's
+	x = np.zeros(lanes, dtype = zx.dtype)
+	y = np.zeros(lanes, dtype = zx.dtype)
+	cx = np.zeros(lanes, dtype = zx.dtype)
+	cy = np.zeros(lanes, dtype = zx.dtype)
+	checkX = np.zeros(lanes, dtype = zx.dtype)
+	checkY = np.zeros(lanes, dtype = zx.dtype)
+	iters = np.zeros(lanes, dtype = np.int32)
+	period = np.zeros(lanes, dtype = np.int32)
+	limit = np.zeros(lanes, dtype = np.int32)
+	result = np.zeros(lanes, dtype = np.int32)
+	size = np.zeros(lanes, dtype = zx.dtype) # |z|^2 where each lane's point escaped
+	done = np.ones(lanes, dtype = np.bool_)
+	index = np.full(lanes, -1, dtype = np.int64) # the point in each lane, or -1 if it's empty
+	bailout = np.full(1, escape, dtype = zx.dtype)[0] # the constants in the points' precision, so float32 lanes stay float32
+	three = np.full(1, 3, dtype = zx.dtype)[0]
+	one = np.full(1, 1, dtype = zx.dtype)[0]
+	nextPoint = 0
+	active = 0
+	while True:
+		for l in range(lanes): # store finished points and start new ones
+			if done[l]:
+				if index[l] >= 0:
+					out[index[l]] = result[l]
+					radius[index[l]] = size[l]
+					index[l] = -1
+					active -= 1
+				if nextPoint < zx.shape[0]:
+					i = nextPoint
+					nextPoint += 1
+					index[l] = i
+					x[l] = cx[l] = checkX[l] = zx[i]
+					y[l] = cy[l] = checkY[l] = zy[i]
+					iters[l] = 0
+					result[l] = 0
+					period[l] = 0
+					limit[l] = 2
+					done[l] = False
+					active += 1
+		if active == 0:
+			return
+		for s in range(steps):
+			for l in range(lanes):
+				x2 = x[l]*x[l]
+				y2 = y[l]*y[l]
+				alive = not done[l]
+				iters[l] += 1 if alive else 0
+				escaped = alive and x2 + y2 > bailout
+				result[l] = iters[l] if escaped else result[l]
+				size[l] = x2 + y2 if escaped else size[l]
+				nx = (x2 - three*y2 + cx[l] - one)*x[l] - y[l]*cy[l] - cx[l]
+				ny = (three*x2 - y2 + cx[l] - one)*y[l] + x[l]*cy[l] - cy[l]
+				x[l] = nx
+				y[l] = ny
+				cycled = periodicity and nx == checkX[l] and ny == checkY[l]
+				period[l] += 1
+				save = period[l] == limit[l]
+				checkX[l] = nx if save else checkX[l]
+				checkY[l] = ny if save else checkY[l]
+				period[l] = 0 if save else period[l]
+				limit[l] = limit[l]*2 if save else limit[l]
+				done[l] = done[l] or escaped or cycled or iters[l] >= maxIter
+
+@jit(cache = True, nogil = True)
+def renderArray(zx, zy, maxIter = 100, periodicity = False): # render a flat array of points in one call, in float32 if the points are float32
+	out = np.zeros(zx.shape[0], dtype = np.int32)
+	iterate(zx, zy, maxIter, periodicity, 4.0, out, np.empty(zx.shape[0], dtype = zx.dtype))
+	return out
+
+@jit(cache = True, nogil = True)
+def renderSmoothArray(zx, zy, maxIter = 100, periodicity = False): # renderArray with continuous counts, see smoothCounts
+	out = np.zeros(zx.shape[0], dtype = np.int32)
+	radius = np.empty(zx.shape[0], dtype = zx.dtype)
+	iterate(zx, zy, maxIter, periodicity, smoothBailout, out, radius)
+	return smoothCounts(out, radius, 3, maxIter)
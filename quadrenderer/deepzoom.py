@@ -0,0 +1,53 @@
+import math
+import numpy as np
+from numba import jit
+
+def referenceOrbit(cx, cy, maxIter, zoom): # Z_0...Z_n of the Mandelbrot orbit of the exact point cx, cy (Fractions) as float64 arrays, computed in fixed point
+	bits = max(64, 64 - math.frexp(zoom)[1]) # enough fractional bits to resolve a pixel, plus headroom
+	one = 1 << bits
+	cx = (cx.numerator << bits)//cx.denominator
+	cy = (cy.numerator << bits)//cy.denominator
+	bailout = 4 << (2*bits)
+	x = y = 0
+	refX = [0.0]
+	refY = [0.0]
+	for i in range(maxIter):
+		x, y = ((x*x - y*y) >> bits) + cx, ((2*x*y) >> bits) + cy
+		refX.append(x/one)
+		refY.append(y/one)
+		if x*x + y*y > bailout: # the pixels' orbits are rebased onto the start once they run past the end
+			break
+	return np.array(refX), np.array(refY)
+
+@jit(cache = True)
+def render(dcx, dcy, refX, refY, maxIter = 100):
+	# iterate the offset of a pixel from the reference orbit in float64: d' = 2*Z*d + d*d + dc
+	dx = 0.0
+	dy = 0.0
+	m = 0
+	last = refX.shape[0] - 1
+	iters = 0
+	while iters < maxIter:
+		iters += 1
+		zx = refX[m]
+		zy = refY[m]
+		dx, dy = 2*(zx*dx - zy*dy) + dx*dx - dy*dy + dcx, 2*(zx*dy + zy*dx) + 2*dx*dy + dcy
+		m += 1
+		x = refX[m] + dx
+		y = refY[m] + dy
+		mag = x*x + y*y
+		if mag > 4.0:
+			return iters # Return the number of iterations if this pixel diverges
+		if mag < dx*dx + dy*dy or m == last:
+			# the offset outgrew the orbit it is relative to (a glitch), or the reference ran out, so rebase onto the start of the reference
+			dx = x
+			dy = y
+			m = 0
+	return 0 # return 0 if the pixel does not diverge
+
+@jit(cache = True, nogil = True)
+def renderArray(dcx, dcy, refX, refY, maxIter = 100): # render a flat array of offsets from the reference point in one call
+	out = np.empty(dcx.shape[0], dtype = np.int32)
+	for i in range(dcx.shape[0]):
+		out[i] = render(dcx[i], dcy[i], refX, refY, maxIter)
+	return out
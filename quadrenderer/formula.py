@@ -0,0 +1,139 @@
+import ast
+import hashlib
+import importlib.util
+import os
+import sys
+import tempfile
+import threading
+import numba
+import numpy as np
+
+version = 2 # bump when the kernel template changes, so formulas cached by older versions are compiled again
+cacheDir = os.environ.get("QUADRENDERER_FORMULAS", os.path.join(os.path.expanduser("~"), ".quadrenderer", "formulas"))
+
+functions = {"sin": "cmath.sin", "cos": "cmath.cos", "tan": "cmath.tan", "sinh": "cmath.sinh", "cosh": "cmath.cosh", "tanh": "cmath.tanh",
+	"exp": "cmath.exp", "log": "cmath.log", "sqrt": "cmath.sqrt", "abs": "abs", "conj": None} # the functions a formula may call, and what they compile to
+operators = {ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.Div: "/", ast.Pow: "**"}
+
+template = '''# generated by quadrenderer.formula from: {expression}
+import cmath
+import numpy as np
+from numba import jit
+
+@jit(cache = True)
+def divide(a, b): # division which gives inf at a pole, so the point escapes, where numba's complex division raises
+	if b == 0:
+		return complex(np.inf, 0.0)
+	return (a + 0j)/(b + 0j)
+
+@jit(cache = True, error_model = 'numpy') # so division by zero gives inf or nan, which escape, instead of raising
+def render(zx, zy, cx, cy, maxIter = 100, periodicity = False):
+	iters = 0
+	z = complex(zx, zy)
+	c = complex(cx, cy)
+	check = z # Brent style cycle detection, as in the built in kernels
+	period = 0
+	limit = 2
+	while True:
+		iters += 1
+		if not z.real*z.real + z.imag*z.imag <= {bailout}: # nan, e.g. from a pole, escapes too
+			return iters
+		z = {code} + 0j
+		if periodicity:
+			if z == check:
+				return 0
+			period += 1
+			if period == limit:
+				check = z
+				period = 0
+				limit *= 2
+		if iters >= maxIter:
+			return 0
+
+
+@jit(cache = True, nogil = True, error_model = 'numpy')
+def renderArray(zx, zy, cx, cy, julia, maxIter = 100, periodicity = False): # render a flat array of points, as Julia set points for cx, cy if julia is set
+	out = np.empty(zx.shape[0], dtype = np.int32)
+	for i in range(zx.shape[0]):
+		if julia:
+			out[i] = render(zx[i], zy[i], cx, cy, maxIter, periodicity)
+		else:
+			out[i] = render(zx[i], zy[i], zx[i], zy[i], maxIter, periodicity)
+	return out
+'''
+
+loaded = {} # compiled modules by key, so each formula is only imported once per session
+compiling = threading.Lock() # held while writing and importing a formula, which render threads may all try at once
+
+
+def translate(node): # check a parsed formula only uses z, c, numbers, arithmetic and known functions, and return it as numba compatible source
+	if isinstance(node, ast.Expression):
+		return translate(node.body)
+	if isinstance(node, ast.Name):
+		if node.id not in ("z", "c"):
+			raise ValueError("unknown name '" + node.id + "', formulas may only use z and c")
+		return node.id
+	if isinstance(node, ast.Constant):
+		if type(node.value) not in (int, float, complex):
+			raise ValueError("only numbers may be used as constants")
+		return "(" + repr(node.value) + ")"
+	if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+		return "(" + ("-" if isinstance(node.op, ast.USub) else "+") + translate(node.operand) + ")"
+	if isinstance(node, ast.BinOp) and type(node.op) in operators:
+		left = translate(node.left)
+		if isinstance(node.op, ast.Pow) and isinstance(node.right, ast.Constant) and type(node.right.value) is int and 1 <= node.right.value <= 8:
+			return "(" + "*".join([left]*node.right.value) + ")" # small integer powers as products, which are much faster than complex pow
+		if isinstance(node.op, ast.Div):
+			return "divide(" + left + ", " + translate(node.right) + ")"
+		return "(" + left + operators[type(node.op)] + translate(node.right) + ")"
+	if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in functions:
+		if len(node.args) != 1 or node.keywords:
+			raise ValueError(node.func.id + " takes exactly one argument")
+		if node.func.id == "conj":
+			return "(" + translate(node.args[0]) + ").conjugate()"
+		return functions[node.func.id] + "(" + translate(node.args[0]) + ")"
+	raise ValueError("unsupported expression: " + type(node).__name__)
+
+
+class Formula(): # an iteration formula in z and c, e.g. "z**2 + c", compiled to escape time kernels once and cached on disk after that
+	def __init__(self, expression, bailout = 4):
+		try:
+			tree = ast.parse(expression.replace("^", "**"), mode = "eval")
+		except SyntaxError as e:
+			raise ValueError("invalid formula: " + str(e.msg)) from None
+		self.expression = expression
+		self.bailout = float(bailout) # escape when |z|^2 passes this
+		self.code = translate(tree)
+		self.key = hashlib.sha1((str(version) + self.code + repr(self.bailout)).encode()).hexdigest()[:16] # formulas differing only in spacing share a kernel
+		self.module = None
+
+	def compile(self): # import the kernels, writing their source on first use; raises ValueError if numba can't compile the formula
+		if self.module is not None:
+			return self.module
+		with compiling:
+			if self.key not in loaded:
+				path = os.path.join(cacheDir, "formula_" + self.key + ".py")
+				if not os.path.exists(path): # never rewrite an existing file, numba's on disk cache is invalidated by its timestamp changing
+					os.makedirs(cacheDir, exist_ok = True)
+					handle, temp = tempfile.mkstemp(suffix = ".tmp", dir = cacheDir) # unique, so other processes writing the same formula don't collide
+					with os.fdopen(handle, "w") as file:
+						file.write(template.format(expression = self.expression.replace("\n", " "), bailout = self.bailout, code = self.code))
+					os.replace(temp, path)
+				spec = importlib.util.spec_from_file_location("formula_" + self.key, path)
+				module = importlib.util.module_from_spec(spec)
+				sys.modules[spec.name] = module # numba's cache finds render again by module name when loading renderArray
+				spec.loader.exec_module(module)
+				point = np.zeros(1)
+				try:
+					module.renderArray(point, point, 0.0, 0.0, False, 1, True) # compile now, or load the compiled kernel from the cache
+				except numba.core.errors.NumbaError as e: # only typing errors, the kernel itself can't raise at any point
+					raise ValueError("formula failed to compile: " + str(e).splitlines()[0]) from None
+				loaded[self.key] = module
+		self.module = loaded[self.key]
+		return self.module
+
+	def render(self, zx, zy, cx, cy, maxIter = 100, periodicity = False):
+		return self.compile().render(zx, zy, cx, cy, maxIter, periodicity)
+
+	def renderArray(self, zx, zy, cx, cy, julia, maxIter = 100, periodicity = False):
+		return self.compile().renderArray(zx, zy, cx, cy, julia, maxIter, periodicity)
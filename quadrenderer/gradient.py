@@ -1,6 +1,11 @@
+import numpy as np
+
 #@jit(cache = True)
 #def render(x, y):
 #	return((max(min(x, 1), 0), max(min(y, 1), 0), max(min(0-x-y, 1), 0)))
 
 def render(x, y, maxIters):
-	return max(min(x, 1), 0)*maxIters
\ No newline at end of file
+	return max(min(x, 1), 0)*maxIters
+
+def renderArray(x, y, maxIters):
+	return np.clip(x, 0, 1)*maxIters
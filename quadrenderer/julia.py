@@ -1,8 +1,14 @@
+import numpy as np
 from numba import jit
+from quadrenderer.mandelbrot import smoothBailout, smoothCounts
 
 @jit(cache = True)
-def render(zReal, zImag, cReal, cImag, maxIter = 100):
+def render(zReal, zImag, cReal, cImag, maxIter = 100, periodicity = False):
 	iters = 0
+	checkReal = zReal # Brent style cycle detection: compare against a saved point, saving a new one at doubling intervals
+	checkImag = zImag
+	period = 0
+	limit = 2
 	while True:
 		iters += 1
 		# Square the real and imaginary components BEFORE checking for divergence
@@ -12,5 +18,93 @@ def render(zReal, zImag, cReal, cImag, maxIter = 100):
 			return iters # Return the number of iterations if this pixel diverges
 		zImag = 2 * zImag * zReal + cImag # Finish the required math for this iteration if the pixel has not diverged yet
 		zReal = real2 - imag2 + cReal
+		if periodicity:
+			if zReal == checkReal and zImag == checkImag: # the orbit has repeated exactly, so it will cycle forever without diverging
+				return 0
+			period += 1
+			if period == limit:
+				checkReal = zReal
+				checkImag = zImag
+				period = 0
+				limit *= 2
 		if iters >= maxIter:
 			return 0 # return 0 if the pixel does not diverge
+
+lanes = 16 # points iterated side by side, which LLVM turns into SIMD instructions
+steps = 8 # iterations between refilling lanes whose points have finished
+
+@jit(cache = True, nogil = True)
+def iterate(zReal, zImag, cReal, cImag, maxIter, periodicity, escape, out, radius): # the lanes behind renderArray and renderSmoothArray, storing each point's count in out and its |z|^2 on escaping in radius
+	# the same lanes as mandelbrot.renderArray, running render's loop; float64 results are identical to render's
+	real = np.zeros(lanes, dtype = zReal.dtype)
+	imag = np.zeros(lanes, dtype = zReal.dtype)
+	checkReal = np.zeros(lanes, dtype = zReal.dtype)
+	checkImag = np.zeros(lanes, dtype = zReal.dtype)
+	iters = np.zeros(lanes, dtype = np.int32)
+	period = np.zeros(lanes, dtype = np.int32)
+	limit = np.zeros(lanes, dtype = np.int32)
+	result = np.zeros(lanes, dtype = np.int32)
+	size = np.zeros(lanes, dtype = zReal.dtype) # |z|^2 where each lane's point escaped
+	done = np.ones(lanes, dtype = np.bool_)
+	index = np.full(lanes, -1, dtype = np.int64) # the point in each lane, or -1 if it's empty
+	bailout = np.full(1, escape, dtype = zReal.dtype)[0] # the constants in the points' precision, so float32 lanes stay float32
+	constReal = np.full(1, cReal, dtype = zReal.dtype)[0]
+	constImag = np.full(1, cImag, dtype = zReal.dtype)[0]
+	nextPoint = 0
+	active = 0
+	while True:
+		for l in range(lanes): # store finished points and start new ones
+			if done[l]:
+				if index[l] >= 0:
+					out[index[l]] = result[l]
+					radius[index[l]] = size[l]
+					index[l] = -1
+					active -= 1
+				if nextPoint < zReal.shape[0]:
+					i = nextPoint
+					nextPoint += 1
+					index[l] = i
+					real[l] = checkReal[l] = zReal[i]
+					imag[l] = checkImag[l] = zImag[i]
+					iters[l] = 0
+					result[l] = 0
+					period[l] = 0
+					limit[l] = 2
+					done[l] = False
+					active += 1
+		if active == 0:
+			return
+		for s in range(steps):
+			for l in range(lanes):
+				real2 = real[l]*real[l]
+				imag2 = imag[l]*imag[l]
+				alive = not done[l]
+				iters[l] += 1 if alive else 0
+				escaped = alive and real2 + imag2 > bailout
+				result[l] = iters[l] if escaped else result[l]
+				size[l] = real2 + imag2 if escaped else size[l]
+				nImag = (imag[l] + imag[l])*real[l] + constImag
+				nReal = real2 - imag2 + constReal
+				real[l] = nReal
+				imag[l] = nImag
+				cycled = periodicity and nReal == checkReal[l] and nImag == checkImag[l]
+				period[l] += 1
+				save = period[l] == limit[l]
+				checkReal[l] = nReal if save else checkReal[l]
+				checkImag[l] = nImag if save else checkImag[l]
+				period[l] = 0 if save else period[l]
+				limit[l] = limit[l]*2 if save else limit[l]
+				done[l] = done[l] or escaped or cycled or iters[l] >= maxIter
+
+@jit(cache = True, nogil = True)
+def renderArray(zReal, zImag, cReal, cImag, maxIter = 100, periodicity = False): # render a flat array of points in one call, in float32 if the points are float32
+	out = np.zeros(zReal.shape[0], dtype = np.int32)
+	iterate(zReal, zImag, cReal, cImag, maxIter, periodicity, 4.0, out, np.empty(zReal.shape[0], dtype = zReal.dtype))
+	return out
+
+@jit(cache = True, nogil = True)
+def renderSmoothArray(zReal, zImag, cReal, cImag, maxIter = 100, periodicity = False): # renderArray with continuous counts, see smoothCounts
+	out = np.zeros(zReal.shape[0], dtype = np.int32)
+	radius = np.empty(zReal.shape[0], dtype = zReal.dtype)
+	iterate(zReal, zImag, cReal, cImag, maxIter, periodicity, smoothBailout, out, radius)
+	return smoothCounts(out, radius, 2, maxIter)
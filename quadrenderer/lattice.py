@@ -0,0 +1,159 @@
+import numpy as np
+from numba import jit
+
+@jit(cache = True)
+def quadPoints(x, y, size, pattern): # the pixel space sample points of every quad, as flat arrays
+	n = pattern.shape[0]
+	xs = np.empty(x.shape[0]*n)
+	ys = np.empty(x.shape[0]*n)
+	for i in range(x.shape[0]):
+		for j in range(n):
+			xs[i*n+j] = x[i] + size[i]*pattern[j, 0]
+			ys[i*n+j] = y[i] + size[i]*pattern[j, 1]
+	return xs, ys
+
+@jit(cache = True)
+def gather(grid, xs, ys, missing, pending): # look up samples on the half pixel lattice, returning them and the index of every distinct point left to render
+	values = np.empty(xs.shape[0], dtype = grid.dtype)
+	todo = np.empty(xs.shape[0], dtype = np.intp)
+	count = 0
+	for i in range(xs.shape[0]):
+		ix = int(xs[i]*2)
+		iy = int(ys[i]*2)
+		values[i] = grid[iy, ix]
+		if values[i] == missing:
+			grid[iy, ix] = pending # mark the point so duplicates later in the batch are not rendered twice
+			todo[count] = i
+			count += 1
+	return values, todo[:count]
+
+@jit(cache = True)
+def scatter(grid, xs, ys, values, todo, rendered): # store newly rendered samples and fill in every value which was waiting on them
+	for k in range(todo.shape[0]):
+		i = todo[k]
+		grid[int(ys[i]*2), int(xs[i]*2)] = rendered[k]
+	for i in range(xs.shape[0]):
+		if values[i] < 0:
+			values[i] = grid[int(ys[i]*2), int(xs[i]*2)]
+	return values
+
+@jit(cache = True)
+def quadStats(colors, size, tolerance = 0.0): # the mean color and subdivision priority of each quad from its row of samples, which vary if any differ by more than tolerance
+	color = np.empty(colors.shape[0])
+	priority = np.zeros(colors.shape[0])
+	for i in range(colors.shape[0]):
+		total = 0.0
+		varied = False
+		for j in range(colors.shape[1]):
+			total += colors[i, j]
+			varied = varied or abs(colors[i, j] - colors[i, 0]) > tolerance
+		color[i] = total/colors.shape[1]
+		if size[i] > 1 and varied:
+			priority[i] = color[i]*size[i]*size[i]
+	return color, priority
+
+@jit(cache = True)
+def paintQuads(iterations, image, x, y, size, color, bgr): # fill each quad's square in the iteration buffer and the image
+	for i in range(x.shape[0]):
+		for py in range(y[i], y[i]+size[i]):
+			for px in range(x[i], x[i]+size[i]):
+				iterations[py, px] = color[i]
+				image[py, px, 0] = bgr[i, 0]
+				image[py, px, 1] = bgr[i, 1]
+				image[py, px, 2] = bgr[i, 2]
+
+
+@jit(cache = True)
+def dirtyRects(x, y, size, res, tile): # the (x, y, width, height) rectangles covering every quad, as runs of tile sized cells along each row of cells
+	n = (res + tile - 1)//tile
+	dirty = np.zeros((n, n + 1), dtype = np.bool_) # the extra column ends every run
+	for i in range(x.shape[0]):
+		for ty in range(y[i]//tile, (y[i] + size[i] - 1)//tile + 1):
+			for tx in range(x[i]//tile, (x[i] + size[i] - 1)//tile + 1):
+				dirty[ty, tx] = True
+	rects = np.empty((n*n, 4), dtype = np.int64)
+	count = 0
+	for ty in range(n):
+		tx = 0
+		while tx < n:
+			if dirty[ty, tx]:
+				start = tx
+				while dirty[ty, tx]:
+					tx += 1
+				rects[count, 0] = start*tile
+				rects[count, 1] = ty*tile
+				rects[count, 2] = min(tx*tile, res) - start*tile
+				rects[count, 3] = min(ty*tile + tile, res) - ty*tile
+				count += 1
+			else:
+				tx += 1
+	return rects[:count]
+
+
+@jit(cache = True)
+def rectBorders(x, y, w, h): # the pixels on the border of every rectangle as flat arrays, with where each rectangle's pixels start
+	starts = np.zeros(x.shape[0] + 1, dtype = np.intp)
+	for i in range(x.shape[0]):
+		rows = 2 if h[i] > 1 else 1
+		sides = 2 if w[i] > 1 else 1
+		starts[i+1] = starts[i] + rows*w[i] + max(h[i] - 2, 0)*sides
+	xs = np.empty(starts[-1], dtype = np.int64)
+	ys = np.empty(starts[-1], dtype = np.int64)
+	for i in range(x.shape[0]):
+		k = starts[i]
+		for py in range(y[i], y[i]+h[i]):
+			if py == y[i] or py == y[i]+h[i]-1:
+				for px in range(x[i], x[i]+w[i]):
+					xs[k] = px
+					ys[k] = py
+					k += 1
+			else:
+				xs[k] = x[i]
+				ys[k] = py
+				k += 1
+				if w[i] > 1:
+					xs[k] = x[i]+w[i]-1
+					ys[k] = py
+					k += 1
+	return xs, ys, starts
+
+@jit(cache = True)
+def unrendered(grid, xs, ys, missing, pending): # the distinct points of xs, ys still missing from grid, which are marked pending so duplicates are only returned once
+	todo = np.empty(xs.shape[0], dtype = np.intp)
+	count = 0
+	for i in range(xs.shape[0]):
+		if grid[ys[i], xs[i]] == missing:
+			grid[ys[i], xs[i]] = pending
+			todo[count] = i
+			count += 1
+	return xs[todo[:count]], ys[todo[:count]]
+
+@jit(cache = True)
+def borderStats(grid, xs, ys, starts): # whether each rectangle's border values in grid all match, and their mean
+	uniform = np.ones(starts.shape[0] - 1, dtype = np.bool_)
+	mean = np.empty(starts.shape[0] - 1)
+	for i in range(starts.shape[0] - 1):
+		total = 0.0
+		first = grid[ys[starts[i]], xs[starts[i]]]
+		for k in range(starts[i], starts[i+1]):
+			value = grid[ys[k], xs[k]]
+			total += value
+			if value != first:
+				uniform[i] = False
+		mean[i] = total/(starts[i+1] - starts[i])
+	return uniform, mean
+
+@jit(cache = True)
+def paintRects(iterations, image, x, y, w, h, color, bgr): # fill each rectangle in the iteration buffer and the image, like paintQuads
+	for i in range(x.shape[0]):
+		for py in range(y[i], y[i]+h[i]):
+			for px in range(x[i], x[i]+w[i]):
+				iterations[py, px] = color[i]
+				image[py, px, 0] = bgr[i, 0]
+				image[py, px, 1] = bgr[i, 1]
+				image[py, px, 2] = bgr[i, 2]
+
+@jit(cache = True)
+def fillRects(grid, x, y, w, h, value): # fill each rectangle of grid with its value
+	for i in range(x.shape[0]):
+		grid[y[i]:y[i]+h[i], x[i]:x[i]+w[i]] = value[i]
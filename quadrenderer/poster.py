@@ -0,0 +1,106 @@
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+import numpy as np
+sys.path.append("..")
+from quadrenderer import animation
+from quadrenderer.renderer import DeepCamera, FormulaRenderer, deepReference
+
+# A poster is rendered a tile at a time into a memory mapped iteration buffer, with a manifest recording the finished tiles,
+# so memory stays bounded by the tile size and an interrupted render carries on where it stopped.
+
+def posterSettings(settings, res, samples, adaptive): # the parts of the manifest that must match to resume a poster
+	return {"settings": {name: str(value) for name, value in settings.items()}, "res": res, "samples": samples, "adaptive": adaptive}
+
+def loadManifest(path, expected): # the finished tiles recorded in a manifest, or none if there isn't one yet
+	if not os.path.exists(path):
+		return set()
+	with open(path) as file:
+		manifest = json.load(file)
+	for key, value in expected.items():
+		if manifest[key] != value:
+			raise ValueError("the poster in " + os.path.dirname(path) + " was started with a different " + key)
+	return set(tuple(tile) for tile in manifest["done"])
+
+def saveManifest(path, expected, done): # rewrite the manifest atomically, so a crash never leaves it half written
+	manifest = dict(expected)
+	manifest["done"] = sorted(done)
+	with open(path + ".tmp", "w") as file:
+		json.dump(manifest, file)
+	os.replace(path + ".tmp", path)
+
+def renderPoster(settings, res, outDir, tileSize = 1024, samples = 4, workers = None, adaptive = False): # render every unfinished tile of a res x res poster into outDir
+	if not os.path.exists(outDir):
+		os.makedirs(outDir)
+	expected = posterSettings(settings, res, samples, adaptive)
+	manifestPath = os.path.join(outDir, "manifest.json")
+	done = loadManifest(manifestPath, expected)
+	bufferPath = os.path.join(outDir, "iterations.f32")
+	iterations = np.memmap(bufferPath, dtype = np.float32, mode = "r+" if os.path.exists(bufferPath) else "w+", shape = (res, res)) # the mean iterations of each pixel, indexed [y][x]
+	renderer = animation.makeRenderer(settings, res, samples, workers, adaptive)
+	if isinstance(renderer.cam, DeepCamera):
+		deepReference(renderer) # compute the reference orbit once, before the tiles are spread across threads
+	if isinstance(renderer, FormulaRenderer):
+		renderer.formula.compile() # likewise compile the formula once
+	tiles = [(x, y) for y in range(0, res, tileSize) for x in range(0, res, tileSize)]
+	for i, (x, y) in enumerate(tiles):
+		if (x, y) in done:
+			continue
+		t = time.time()
+		region = (x, y, min(tileSize, res-x), min(tileSize, res-y))
+		total = renderer.renderAdaptive(region) if adaptive and renderer.AA > 1 else renderer.engine.render(region = region)
+		iterations[y:y+region[3], x:x+region[2]] = total/renderer.sampleCount()
+		iterations.flush() # the tile must be on disk before the manifest says it's done
+		done.add((x, y))
+		saveManifest(manifestPath, expected, done)
+		print("Tile " + str(i+1) + "/" + str(len(tiles)) + " took " + str(round(time.time()-t, 2)) + "s")
+	return renderer, iterations
+
+def writePNG(path, width, height, strips): # write an 8 bit RGB PNG from an iterable of row strips, compressing as it goes so the image is never all in memory
+	def chunk(kind, data):
+		file.write(struct.pack(">I", len(data)) + kind)
+		file.write(data)
+		file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind)) & 0xffffffff))
+	with open(path + ".tmp", "wb") as file:
+		file.write(b"\x89PNG\r\n\x1a\n")
+		chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+		compressor = zlib.compressobj(6)
+		previous = np.zeros(width*3, dtype = np.uint8)
+		for strip in strips:
+			strip = strip.reshape(len(strip), -1)
+			rows = np.empty((len(strip), width*3 + 1), dtype = np.uint8)
+			rows[:, 0] = 2 # PNG's "up" filter: each row is stored as its difference from the row above, which compresses far better
+			rows[0, 1:] = strip[0] - previous
+			rows[1:, 1:] = strip[1:] - strip[:-1]
+			previous = strip[-1].copy()
+			data = compressor.compress(rows)
+			if data:
+				chunk(b"IDAT", data)
+		chunk(b"IDAT", compressor.flush())
+		chunk(b"IEND", b"")
+	os.replace(path + ".tmp", path)
+
+def writePoster(renderer, iterations, path, stripHeight = 256): # color the iteration buffer a strip at a time into a PNG, flipped like RendererWidget.saveImage
+	res = iterations.shape[0]
+	def strips():
+		for bottom in range(res, 0, -stripHeight):
+			top = max(bottom - stripHeight, 0)
+			yield renderer.colorProfile.colorize(iterations[top:bottom][::-1], renderer.maxIters, renderer.sampleCount(), renderer.colorSlice, renderer.smooth)
+	writePNG(path, res, res, strips())
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description = "Render a poster of a .qr view a tile at a time, resuming if it was interrupted.")
+	parser.add_argument("settings", help = "a .qr file saved by the application")
+	parser.add_argument("--res", type = int, default = 16384)
+	parser.add_argument("--tile", type = int, default = 1024)
+	parser.add_argument("--samples", type = int, default = 4, choices = range(1, 8), metavar = "{1-7}", help = "anti-aliasing samples per pixel, at most 7 as FullRenderer takes")
+	parser.add_argument("--workers", type = int, default = None, help = "render threads, defaults to one per core")
+	parser.add_argument("--adaptive", action = "store_true", help = "anti-alias only the pixels on edges")
+	parser.add_argument("--out", default = "poster")
+	args = parser.parse_args()
+	renderer, iterations = renderPoster(animation.loadSettings(args.settings), args.res, args.out, args.tile, args.samples, args.workers, args.adaptive)
+	writePoster(renderer, iterations, os.path.join(args.out, "poster.png"))
@@ -0,0 +1,54 @@
+import time
+start = time.time() # for measuring time to first frame from process start
+import os
+import sys
+sys.path.append("..")
+
+def warmup(res = 16): # render a tiny view with every renderer, so numba compiles each kernel (or loads it from its cache) before the first real frame
+	from quadrenderer import renderer
+	for quadRenderer in (renderer.RealtimeQuadRenderer, renderer.RealtimeJuliaQuadRenderer, renderer.RealtimeCactusQuadRenderer,
+			renderer.RealtimeGradientQuadRenderer, renderer.RealtimeDeepQuadRenderer):
+		r = quadRenderer(res = res, AA = 8, maxIters = 100)
+		r.begin()
+		while r.tick():
+			pass
+		r.updateImage()
+	for scanRenderer in (renderer.ScanRenderer, renderer.JuliaScanRenderer, renderer.CactusScanRenderer, renderer.BoundaryTraceRenderer):
+		r = scanRenderer(res = res, AA = 8, maxIters = 100)
+		r.begin()
+		while r.tick():
+			pass
+	for fullRenderer in (renderer.FullRenderer, renderer.JuliaFullRenderer, renderer.CactusFullRenderer, renderer.GradientRenderer,
+			renderer.SquareMandelRenderer, renderer.DeepFullRenderer):
+		r = fullRenderer(res, res, 9, 100, workers = 1)
+		r.engine.render() # the tiles without render's timing printout
+	for smoothRenderer in (renderer.FullRenderer, renderer.JuliaFullRenderer, renderer.CactusFullRenderer): # the smooth kernels, which are never previewed in float32
+		r = smoothRenderer(res, res, 9, 100, workers = 1)
+		r.smooth = True
+		r.engine.render()
+
+def cacheDir(): # where numba should keep compiled kernels: the default (next to the sources) unless that can't be written, e.g. in a frozen build
+	if getattr(sys, "frozen", False):
+		local = os.path.join(os.path.dirname(sys.executable), "numba_cache") # shipped with the build, see build.bat
+		if os.access(os.path.dirname(sys.executable), os.W_OK):
+			return local
+		return os.path.join(os.path.expanduser("~"), ".quadrenderer", "numba_cache")
+	return None
+
+def configureCache(): # must run before numba is imported
+	path = cacheDir()
+	if path is not None:
+		os.environ.setdefault("NUMBA_CACHE_DIR", path)
+
+if __name__ == "__main__": # compile every kernel, then report how long a first frame takes
+	configureCache()
+	t = time.time()
+	from quadrenderer.renderer import FullRenderer
+	imported = time.time()
+	warmup()
+	warm = time.time()
+	renderer = FullRenderer(512, 512, 9, 1000)
+	renderer.render()
+	renderer.colorImage()
+	end = time.time()
+	print("import " + str(round(imported-t, 2)) + "s, warm-up " + str(round(warm-imported, 2)) + "s, 512px frame " + str(round(end-warm, 2)) + "s, first frame " + str(round(end-start, 2)) + "s after start")
@@ -1,218 +1,710 @@
 import numpy as np
 import os
-import cv2
 import time
 import gc
+import heapq
+import threading
+import traceback
+from fractions import Fraction
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 sys.path.append("..")
-from quadrenderer import gradient, mandelbrot, cactus, julia, profile
+from quadrenderer import gradient, mandelbrot, cactus, julia, deepzoom, lattice, formula, stats
+# cv2 is imported where it's used, so importing the renderers stays quick
+
+AAList = [(.25, .25), (.75, .75), (.25, .75), (.75, .25), (.5, .1), (.5, .9), (.1, .5), (.9, .5)] # the pixel offsets of each anti-aliasing sample
+smoothLevels = 16 # colors per sample level for continuous escape counts, see ColorConverter.colorize
+float32Spacing = 2**-11 # the smallest pixel spacing, relative to the largest coordinate in view, previewed in float32
+# float32 escape counts differ from float64 anywhere an orbit passes close to the bailout, at any count, so no float32 sample can be kept:
+# with precision "auto" the interactive renderers preview a view in float32, then render it again in float64 once the preview converges
+
+
+def coordinateType(renderer): # the precision a renderer's kernel iterates in: float32 while previewing pixels coarse next to float32's precision, float64 past that
+	if not renderer.float32Kernels or renderer.precision == "float64":
+		return np.float64
+	if renderer.precision == "float32":
+		return np.float32
+	if not renderer.preview or renderer.smooth: # smooth counts would differ from float64 at almost every sample, so a preview gains nothing
+		return np.float64
+	cam = renderer.cam
+	if isinstance(cam, DeepCamera):
+		return np.float64
+	extent = max(abs(cam.xPos), abs(cam.xPos + cam.zoom), abs(cam.yPos), abs(cam.zoom - cam.yPos))
+	return np.float32 if cam.zoom/cam.xRes >= float32Spacing*extent else np.float64
+
+def kernel(renderer, coords): # render points through the renderer's kernel, counting the work if stats are enabled
+	if coordinateType(renderer) is np.float32:
+		coords = (coords[0].astype(np.float32), coords[1].astype(np.float32))
+	with stats.timed("kernel"):
+		pix = renderer.renderPoints(coords)
+	if stats.enabled:
+		stats.add("samples", len(pix))
+		stats.add("iterations", int(pix.sum())) # escape counts, so points inside the set count as none
+	return pix
+
+
+def renderSamples(renderer, xs, ys, offsets): # render the pixels at xs, ys once per AA offset in a single batch, returning the summed iterations
+	if len(offsets) == 0:
+		return np.zeros(xs.shape)
+	ox = np.array([o[0] for o in offsets]).reshape(-1, 1)
+	oy = np.array([o[1] for o in offsets]).reshape(-1, 1)
+	pix = kernel(renderer, renderer.cam.convertPos((xs.reshape(1, -1)+ox).ravel(), (ys.reshape(1, -1)+oy).ravel()))
+	return pix.reshape(len(offsets), -1).sum(axis = 0).reshape(xs.shape)
+
+
+class TileEngine(): # splits a renderer's viewport into tiles and renders them across a pool of threads
+	def __init__(self, renderer, tileSize = 64, workers = None):
+		self.renderer = renderer
+		self.tileSize = tileSize
+		self.predictedTileSize = 32 # the tiles renderCoherent checks, smaller than those rendered so more of them are uniform
+		self.workers = workers or os.cpu_count() # the kernels release the GIL, so threads run them in parallel
+
+	def tiles(self, region = None, size = None): # the (x, y, width, height) of every tile in the viewport, or in an (x, y, width, height) region of it
+		left, top, width, height = region or (0, 0, self.renderer.cam.xRes, self.renderer.cam.yRes)
+		size = size or self.tileSize
+		for y in range(top, top+height, size):
+			for x in range(left, left+width, size):
+				yield x, y, min(size, left+width-x), min(size, top+height-y)
+
+	def render(self, offsets = None, region = None): # render every tile and reassemble them into one array, indexed [y][x], optionally with other AA offsets than the renderer's
+		left, top, width, height = region or (0, 0, self.renderer.cam.xRes, self.renderer.cam.yRes)
+		out = np.zeros((height, width))
+		def renderTile(tile):
+			x, y, tileWidth, tileHeight = tile
+			out[y-top:y-top+tileHeight, x-left:x-left+tileWidth] = self.renderer.renderBlock(x, y, tileWidth, tileHeight, offsets)
+		if self.workers == 1:
+			for tile in self.tiles(region):
+				renderTile(tile)
+		else:
+			with ThreadPoolExecutor(self.workers) as pool:
+				list(pool.map(renderTile, self.tiles(region)))
+		self.rendered = width*height # the number of pixels rendered, counting each AA sample once
+		return out
+
+	def renderCoherent(self, previous, stride = 8, minSaving = .25): # render using previous, a prediction of every pixel's summed samples (e.g. the last animation frame), indexed [y][x]
+		cost = np.nan_to_num(previous, nan = 0) # the iterations each pixel is predicted to take, where points inside the set (and unknown ones) take them all
+		cost[(cost == 0) | np.isnan(previous)] = self.renderer.maxIters*self.renderer.sampleCount()
+		uniform = []
+		saving = 0
+		for x, y, width, height in self.tiles(size = self.predictedTileSize):
+			guess = previous[y:y+height, x:x+width]
+			if np.all(guess == guess[0, 0]): # nan never compares equal, so tiles the previous frame didn't cover are always rendered
+				uniform.append((x, y, width, height))
+				saving += cost[y+1:y+height-1, x+1:x+width-1].sum()
+		if saving < minSaving*cost.sum(): # mostly cheap exterior tiles, or too few, which the checks and scattered renders would cost more than they save
+			return self.render()
+		out = np.full(previous.shape, np.nan)
+		check = np.zeros(previous.shape, dtype = bool)
+		for x, y, width, height in uniform:
+			# a uniform tile is only checked on its edges, which for a connected set bound everything inside, and on a sparse lattice for safety
+			tileCheck = check[y:y+height, x:x+width]
+			tileCheck[[0, -1], :] = True
+			tileCheck[:, [0, -1]] = True
+			tileCheck[::stride, ::stride] = True
+		self.renderMask(out, check)
+		for x, y, width, height in uniform:
+			tile = out[y:y+height, x:x+width]
+			if np.all(tile[check[y:y+height, x:x+width]] == previous[y, x]):
+				tile[:] = previous[y, x]
+		rest = np.isnan(out)
+		self.renderMask(out, rest) # everything else, without rendering the checked pixels of failed tiles again
+		self.rendered = np.count_nonzero(check) + np.count_nonzero(rest)
+		return out
+
+	def renderMask(self, out, mask, left = 0, top = 0, chunkSize = 4096): # render the pixels where mask is set into out, in batches spread across the pool, with out and mask covering the view from left, top
+		ys, xs = np.nonzero(mask)
+		chunks = [slice(i, i+chunkSize) for i in range(0, len(xs), chunkSize)]
+		def renderChunk(chunk):
+			out[ys[chunk], xs[chunk]] = renderSamples(self.renderer, xs[chunk]+left, ys[chunk]+top, AAList[:self.renderer.AA])
+		if self.workers == 1:
+			for chunk in chunks:
+				renderChunk(chunk)
+		else:
+			with ThreadPoolExecutor(self.workers) as pool:
+				list(pool.map(renderChunk, chunks))
+
+
+def edgeMask(iterations, threshold): # the pixels whose iteration count differs from any of their 8 neighbours' by more than threshold, which need anti-aliasing
+	padded = np.pad(iterations, 1, mode = 'edge')
+	height, width = iterations.shape
+	mask = np.zeros(iterations.shape, dtype = bool)
+	for dy in range(3):
+		for dx in range(3):
+			if dy != 1 or dx != 1:
+				mask |= np.abs(padded[dy:dy+height, dx:dx+width] - iterations) > threshold
+	return mask
+
+
+def projectSamples(total, oldCam, cam): # move an earlier view's per-pixel values into cam's view by nearest pixel, with nan where the earlier view didn't reach
+	yRes, xRes = total.shape
+	scale = cam.zoom/oldCam.zoom
+	xs = np.rint(np.arange(cam.xRes)*scale + float(cam.xPos - oldCam.xPos)*xRes/oldCam.zoom).astype(np.intp)
+	ys = np.rint(np.arange(cam.yRes)*scale - float(cam.yPos - oldCam.yPos)*yRes/oldCam.zoom).astype(np.intp)
+	xValid = (xs >= 0) & (xs < xRes)
+	yValid = (ys >= 0) & (ys < yRes)
+	out = np.full((cam.yRes, cam.xRes), np.nan)
+	out[np.ix_(yValid, xValid)] = total[np.ix_(ys[yValid], xs[xValid])]
+	return out
+
+
+samplePattern = np.array([(0, 0), (1, 1), (1, 0), (0, 1), (.5, .5), (.5, 0), (0, .5), (.5, 1), (1, .5)]) # the sample points of a quad as fractions of its size, in order of importance
+
 
 class FullRenderer(): # a "traditional" per-pixel Mandelbrot renderer
-	def __init__(self, xRes = 512, yRes = 512, AA = 0, maxIters = 100):
+	float32Kernels = True # whether renderPoints can iterate in float32, see coordinateType
+
+	def __init__(self, xRes = 512, yRes = 512, AA = 0, maxIters = 100, workers = None):
 		self.xRes = xRes
 		self.yRes = yRes
 		self.AA = min(max(AA-1, 0), 7)
 		self.maxIters = maxIters
+		self.periodicity = True # skip the iteration budget for points detected inside the set
+		self.colorProfile = ColorConverter()
+		self.colorSlice = 0
+		self.adaptive = False # anti-alias only the pixels on edges, see edgeMask
+		self.edgeThreshold = 0
+		self.precision = "float64" # "auto", "float32" or "float64", see coordinateType. Exports, animations and posters stay exact
+		self.preview = False # a full render is never refined, so "auto" renders it in float64
+		self.smooth = False # render continuous escape counts instead of whole iterations, which hides banding at lower AA, see mandelbrot.smoothCounts
 
 		self.cam = Camera(xRes, yRes, xPos = -.5)
+		self.engine = TileEngine(self, workers = workers)
 
-	def render(self):
+	def render(self, previous = None): # optionally predict from previous, an earlier frame's total projected into this view
 		t = time.time()
+		if previous is not None:
+			total = self.engine.renderCoherent(previous)
+		elif self.adaptive and self.AA > 1:
+			total = self.renderAdaptive()
+		else:
+			total = self.engine.render()
+		self.total = total # the summed samples of each pixel, kept so the next animation frame can be predicted from them
+		self.iterations = (total/self.sampleCount()).astype(np.float32) # the mean iterations of each pixel, indexed [y][x]
 		image = np.zeros((self.xRes, self.yRes, 3), dtype=np.uint8)
-		for y in range(self.yRes):
-			for x in range(self.xRes):
-				pix = []
-				AAList = [(x+.25, y+.25), (x+.75, y+.75), (x+.25, y+.75), (x+.75, y+.25), (x+.5, y+.1), (x+.5, y+.9), (x+.1, y+.5), (x+.9, y+.5)]
-				for i in range(self.AA):
-					pix.append(self.renderPixel(self.cam.convertPos(AAList[i][0], AAList[i][1])))
-				col = sum(pix)
-				image[x][y] = (col, col, col)
+		image[:] = np.clip(np.rint(total.T), 0, 255).astype(np.uint8)[:, :, None] # round smooth counts and saturate rather than wrap
 
 		print("Render time was " + str(time.time()-t) + " seconds.")
 		return image
 
+	def sampleCount(self): # the number of samples averaged into each value of the iteration buffer
+		return max(self.AA, 1)
+
+	def colorImage(self): # color the iteration buffer, indexed [y][x] like the realtime renderers' images
+		return self.colorProfile.colorize(self.iterations, self.maxIters, self.sampleCount(), self.colorSlice, self.smooth)
+
+	def loadBuffer(self, iterations): # use a saved iteration buffer in place of rendering
+		self.iterations = iterations
+
+	def renderBlock(self, x, y, width, height, offsets = None): # render the summed AA samples of a block of pixels, indexed [y][x]
+		ys, xs = np.mgrid[y:y+height, x:x+width]
+		return renderSamples(self, xs, ys, AAList[:self.AA] if offsets is None else offsets)
+
+	def renderAdaptive(self, region = None): # one sample per pixel, then every AA sample only for pixels on an edge in the iteration counts
+		if region is None:
+			region = (0, 0, self.cam.xRes, self.cam.yRes)
+		x, y, w, h = region
+		left, top = max(x-1, 0), max(y-1, 0) # with a pixel of margin, so edges on the region's border match rendering the whole image
+		right, bottom = min(x+w+1, self.cam.xRes), min(y+h+1, self.cam.yRes)
+		center = self.engine.render([(.5, .5)], (left, top, right-left, bottom-top))
+		edges = edgeMask(center, self.edgeThreshold)[y-top:y-top+h, x-left:x-left+w]
+		total = center[y-top:y-top+h, x-left:x-left+w]*self.sampleCount() # flat pixels count as AA samples that all agreed
+		self.engine.renderMask(total, edges, x, y)
+		self.supersampled = np.count_nonzero(edges)/edges.size
+		return total
+
 	def renderPixel(self, coords):
 		return mandelbrot.render(coords[0], coords[1], self.maxIters)
 
+	def renderPoints(self, coords): # render flat arrays of coordinates in one kernel call
+		render = mandelbrot.renderSmoothArray if self.smooth else mandelbrot.renderArray
+		return render(coords[0], coords[1], self.maxIters, self.periodicity)
+
 
 class GradientRenderer(FullRenderer):
-	def __init__(self, xRes = 512, yRes = 512, AA = 0, maxIters = 100):
-		super().__init__(xRes, yRes, AA, maxIters)
+	float32Kernels = False
+
+	def __init__(self, xRes = 512, yRes = 512, AA = 0, maxIters = 100, workers = None):
+		super().__init__(xRes, yRes, AA, maxIters, workers)
 		self.cam.xPos = .5
 		self.cam.zoom = 1
 
 	def renderPixel(self, coords):
-		return gradient.render(coords[0], coords[1])
+		return gradient.render(coords[0], coords[1], self.maxIters)
+
+	def renderPoints(self, coords):
+		return gradient.renderArray(coords[0], coords[1], self.maxIters)
 
 
 class SquareMandelRenderer(FullRenderer):
-	def __init__(self, xRes = 512, yRes = 512, AA = 0, maxIters = 100):
-		super().__init__(xRes, yRes, AA, maxIters)
+	float32Kernels = False
+
+	def __init__(self, xRes = 512, yRes = 512, AA = 0, maxIters = 100, workers = None):
+		super().__init__(xRes, yRes, AA, maxIters, workers)
 
 	def renderPixel(self, coords):
 		return mandelbrot.renderSquare(coords[0], coords[1], self.maxIters)
 
+	def renderPoints(self, coords):
+		return mandelbrot.renderSquareArray(coords[0], coords[1], self.maxIters, self.periodicity)
+
 
 class JuliaFullRenderer(FullRenderer): # a traditional Julia renderer
-	def __init__(self, xRes = 512, yRes = 512, AA = 0, maxIters = 100, cx = 0.3, cy = .5):
-		super().__init__(xRes, yRes, AA, maxIters)
+	def __init__(self, xRes = 512, yRes = 512, AA = 0, maxIters = 100, cx = 0.3, cy = .5, workers = None):
+		super().__init__(xRes, yRes, AA, maxIters, workers)
 		self.cx = cx
 		self.cy = cy
 
 	def renderPixel(self, coords):
 		return julia.render(coords[0], coords[1], self.cx, self.cy, self.maxIters)
 
+	def renderPoints(self, coords):
+		render = julia.renderSmoothArray if self.smooth else julia.renderArray
+		return render(coords[0], coords[1], self.cx, self.cy, self.maxIters, self.periodicity)
+
 
 class CactusFullRenderer(FullRenderer): # a traditional Cactus renderer
-	def __init__(self, xRes = 512, yRes = 512, AA = 0, maxIters = 100):
-		super().__init__(xRes, yRes, AA, maxIters)
+	def __init__(self, xRes = 512, yRes = 512, AA = 0, maxIters = 100, workers = None):
+		super().__init__(xRes, yRes, AA, maxIters, workers)
 		self.cam.xPos = 0
 
 	def renderPixel(self, coords):
 		return cactus.render(coords[0], coords[1], self.maxIters)
 
+	def renderPoints(self, coords):
+		render = cactus.renderSmoothArray if self.smooth else cactus.renderArray
+		return render(coords[0], coords[1], self.maxIters, self.periodicity)
+
+
+class DeepFullRenderer(FullRenderer): # a traditional Mandelbrot renderer using perturbation theory, for zooms beyond float64 precision
+	float32Kernels = False # perturbation needs every bit of its offsets
+
+	def __init__(self, xRes = 512, yRes = 512, AA = 0, maxIters = 100, workers = None):
+		super().__init__(xRes, yRes, AA, maxIters, workers)
+		self.cam = DeepCamera(xRes, yRes, xPos = -.5)
+		self.reference = None
+
+	def render(self, previous = None):
+		deepReference(self) # compute the reference orbit once, before the tiles are spread across threads
+		return super().render(previous)
+
+	def renderPixel(self, coords):
+		return deepzoom.render(coords[0], coords[1], *deepReference(self), self.maxIters)
+
+	def renderPoints(self, coords):
+		return deepzoom.renderArray(coords[0], coords[1], *deepReference(self), self.maxIters)
+
 
 
 class ScanRenderer():
-	def __init__(self, res = 512, AA = 0, maxIters = 100):
+	float32Kernels = True
+
+	def __init__(self, res = 512, AA = 0, maxIters = 100, progressive = False):
 		self.res = res
 		self.AA = min(AA, 7)
 		self.maxIters = maxIters
+		self.periodicity = True
 		self.colorProfile = ColorConverter()
 		self.colorSlice = 0
+		self.progressive = progressive # render coarse to fine passes, each pixel filling its block until finer passes replace it, instead of raster order
+		self.coarsest = 32 # the block size of the first progressive pass
+		self.pixelsPerTick = 16
+		self.tickBudget = None # if set, pixelsPerTick is tuned each tick so a tick takes about this many seconds
+		self.adaptive = False # render one sample per pixel, then every AA sample only for the pixels on edges, see edgeMask
+		self.edgeThreshold = 0
+		self.precision = "auto" # see coordinateType
+		self.preview = True # whether this pass may be a float32 preview, which escalate renders again in float64
+		self.smooth = False # see FullRenderer
 
 		self.cam = Camera(res, res, xPos = -.5)
 
 	def renderPixel(self, coords):
 		return mandelbrot.render(coords[0], coords[1], self.maxIters)
 
-	def begin(self): # begin or restart the render (e.g. when the position changes)
-		self.image = np.zeros(shape=(self.res, self.res, 3), dtype=np.uint8)
-		self.currentX = 0
-		self.currentY = 0
+	def renderPoints(self, coords):
+		render = mandelbrot.renderSmoothArray if self.smooth else mandelbrot.renderArray
+		return render(coords[0], coords[1], self.maxIters, self.periodicity)
+
+	def sampleCount(self):
+		return self.AA
 
-	def tick(self): # render and update a pixel
-		for i in range(16):
-			if self.currentY >= self.res:
+	def begin(self, preview = True): # begin or restart the render (e.g. when the position changes)
+		self.preview = preview
+		self.image = np.zeros(shape=(self.res, self.res, 3), dtype=np.uint8)
+		self.iterations = np.zeros(shape=(self.res, self.res), dtype=np.float32)
+		self.order, self.blocks = scanOrder(self.res, self.coarsest if self.progressive else 1)
+		self.position = 0 # the next pixel in order
+		self.refining = False # whether the adaptive edge pass has started
+		self.offsets = [(.5, .5)] if self.adaptive and self.AA > 1 else AAList[:self.AA] # the samples the current pass takes of each pixel
+		self.dirtyTop = self.res # the rows drawn since the last updateImage
+		self.dirtyBottom = 0
+
+	def beginFrom(self, xPos, yPos, zoom): # the scanline renderer keeps nothing worth reusing after the view moves
+		self.begin()
+
+	def loadBuffer(self, iterations): # show a saved iteration buffer in place of rendering
+		self.begin(False)
+		self.iterations = iterations
+		self.position = len(self.order)
+		self.fullUpdateImage()
+
+	def escalate(self): # render the converged float32 preview again in float64, in raster order over the preview
+		image, iterations = self.image, self.iterations
+		self.begin(False)
+		self.image, self.iterations = image, iterations
+		self.order, self.blocks = scanOrder(self.res)
+
+	def tick(self): # render and draw the next pixelsPerTick pixels in one batch
+		if self.position >= len(self.order):
+			if len(self.offsets) == self.AA or self.refining:
+				if self.preview and coordinateType(self) is np.float32:
+					self.escalate()
+					return True
+				return False
+			self.order = np.flatnonzero(edgeMask(self.iterations, self.edgeThreshold)).astype(np.int32) # go back over the edges with every sample
+			self.blocks = np.ones(len(self.order), dtype = np.int32)
+			self.position = 0
+			self.offsets = AAList[:self.AA]
+			self.refining = True
+			if not len(self.order):
 				return False
-			pix = []
-			x, y = self.currentX, self.currentY
-			AAList = [(x+.25, y+.25), (x+.75, y+.75), (x+.25, y+.75), (x+.75, y+.25), (x+.5, y+.1), (x+.5, y+.9), (x+.1, y+.5), (x+.9, y+.5)]
-			for i in range(self.AA):
-				pix.append(self.renderPixel(self.cam.convertPos(AAList[i][0], AAList[i][1])))
-			color = sum(pix)/len(pix)
-			c = self.colorProfile.convert(color/self.maxIters)
-			self.image[self.currentY][self.currentX] = np.append(c[self.colorSlice:], c[:self.colorSlice])
-			self.currentX += 1
-			if self.currentX >= self.res:
-				self.currentX = 0
-				self.currentY += 1
+		t = time.time()
+		batch = slice(self.position, self.position + self.pixelsPerTick)
+		ys, xs = np.divmod(self.order[batch], self.res)
+		iterations = (renderSamples(self, xs, ys, self.offsets)/len(self.offsets)).astype(np.float32)
+		colors = self.colorProfile.colorize(iterations, self.maxIters, self.sampleCount(), self.colorSlice, self.smooth)
+		sizes = np.minimum(self.blocks[batch], np.minimum(self.res - xs, self.res - ys)) # blocks on the far edges are cut short
+		with stats.timed("paint"):
+			lattice.paintQuads(self.iterations, self.image, xs, ys, sizes, iterations, colors)
+		self.dirtyTop = min(self.dirtyTop, ys.min())
+		self.dirtyBottom = max(self.dirtyBottom, (ys + sizes).max())
+		self.position += self.pixelsPerTick
+		if self.tickBudget:
+			ratio = min(max(self.tickBudget/max(time.time()-t, 1e-6), .5), 2) # limit the change per tick to avoid oscillating
+			self.pixelsPerTick = max(16, int(self.pixelsPerTick*ratio))
 		return True
 
-	def updateImage(self):
-		pass
+	def updateImage(self): # tick already draws each pixel, so just return the rows drawn since the last call
+		top, bottom = self.dirtyTop, self.dirtyBottom
+		self.dirtyTop, self.dirtyBottom = self.res, 0
+		if bottom <= top:
+			return []
+		return [[0, top, self.res, bottom - top]]
 
-	def fullUpdateImage(self):
-		pass
+	def fullUpdateImage(self): # recolor every pixel rendered so far from the iteration buffer
+		self.image[:] = self.colorProfile.colorize(self.iterations, self.maxIters, self.sampleCount(), self.colorSlice, self.smooth)
+		return [[0, 0, self.res, self.res]]
+
+
+def scanOrder(res, coarsest = 1): # the flat index of every pixel in render order, and the block each fills, in passes from coarsest blocks to single pixels
+	# each pass renders the pixels on its step's grid that no coarser pass rendered, so no pixel is rendered twice
+	order = []
+	blocks = []
+	step = coarsest
+	while step >= 1:
+		ys, xs = np.mgrid[0:res:step, 0:res:step]
+		new = ((ys % (2*step)) != 0) | ((xs % (2*step)) != 0) if step < coarsest else np.ones(ys.shape, dtype = bool)
+		order.append((ys*res + xs)[new].astype(np.int32))
+		blocks.append(np.full(order[-1].shape, step, dtype = np.int32))
+		step //= 2
+	return np.concatenate(order), np.concatenate(blocks)
 
 
 class CactusScanRenderer(ScanRenderer):
 	def renderPixel(self, coords):
 		return cactus.render(coords[0], coords[1], self.maxIters)
 
+	def renderPoints(self, coords):
+		render = cactus.renderSmoothArray if self.smooth else cactus.renderArray
+		return render(coords[0], coords[1], self.maxIters, self.periodicity)
+
 
 class JuliaScanRenderer(ScanRenderer):
 	def renderPixel(self, coords):
 		return julia.render(coords[0], coords[1], .3, .5, self.maxIters)
 
+	def renderPoints(self, coords):
+		render = julia.renderSmoothArray if self.smooth else julia.renderArray
+		return render(coords[0], coords[1], .3, .5, self.maxIters, self.periodicity)
+
+
+
+class BoundaryTraceRenderer(): # a Mariani-Silver renderer, which renders only the borders of rectangles and fills those whose border is one color
+	# escape time level sets are connected, so a rectangle with a uniform border is uniform inside, and anything else is split in four
+	float32Kernels = True
+
+	def __init__(self, res = 512, AA = 0, maxIters = 100):
+		self.res = res
+		self.AA = min(AA, 8)
+		self.maxIters = maxIters
+		self.periodicity = True
+		self.colorProfile = ColorConverter()
+		self.colorSlice = 0
+		self.batchSize = 16 # the number of rectangles traced per tick
+		self.pixelsPerTick = 256 # the number of edge pixels anti-aliased per tick, once tracing is done
+		self.tickBudget = None # if set, batchSize and pixelsPerTick are tuned each tick so a tick takes about this many seconds
+		self.edgeThreshold = 0 # see edgeMask
+		self.precision = "auto" # see coordinateType
+		self.preview = True # see ScanRenderer
+		self.smooth = False # always, since the fills need whole iterations
+
+		self.cam = Camera(res, res, xPos = -.5)
+
+	def renderPixel(self, coords):
+		return mandelbrot.render(coords[0], coords[1], self.maxIters)
+
+	def renderPoints(self, coords):
+		return mandelbrot.renderArray(coords[0], coords[1], self.maxIters, self.periodicity)
+
+	def sampleCount(self):
+		return max(self.AA, 1)
+
+	def begin(self, preview = True): # begin or restart the render (e.g. when the position changes)
+		self.preview = preview
+		self.image = np.zeros(shape=(self.res, self.res, 3), dtype=np.uint8)
+		self.iterations = np.zeros(shape=(self.res, self.res), dtype=np.float32) # the mean iterations of each pixel, or of its rectangle's border until it's traced
+		self.traced = np.full((self.res, self.res), SampleGrid.missing, dtype = np.float32) # the center sample of each pixel, once rendered or filled
+		self.pending = deque([np.array([[0, 0, self.res, self.res]], dtype = np.int64)]) # (x, y, width, height) rectangles left to trace, largest first
+		self.edges = None # the flat index of every pixel left to anti-alias, once tracing is done
+		self.position = 0 # the next pixel in edges
+		self.rendered = 0 # the number of samples rendered
+		self.dirtyTop = self.res # the rows drawn since the last updateImage
+		self.dirtyBottom = 0
+
+	def beginFrom(self, xPos, yPos, zoom): # the traced rectangles aren't worth reusing after the view moves
+		self.begin()
+
+	def loadBuffer(self, iterations): # show a saved iteration buffer in place of rendering
+		self.begin(False)
+		self.iterations = iterations
+		self.pending.clear()
+		self.edges = np.zeros(0, dtype = np.intp)
+		self.fullUpdateImage()
+
+	def escalate(self): # trace the converged float32 preview again in float64, drawing over the preview
+		image, iterations = self.image, self.iterations
+		self.begin(False)
+		self.image, self.iterations = image, iterations
+
+	def take(self, count): # remove and return up to count of the pending rectangles
+		rects = []
+		while self.pending and count > 0:
+			r = self.pending.popleft()
+			if len(r) > count:
+				self.pending.appendleft(r[count:])
+				r = r[:count]
+			rects.append(r)
+			count -= len(r)
+		return np.concatenate(rects)
+
+	def paint(self, x, y, w, h, values): # draw rectangles of mean iterations into the buffer and the image
+		colors = self.colorProfile.colorize(values, self.maxIters, self.sampleCount(), self.colorSlice)
+		with stats.timed("paint"):
+			lattice.paintRects(self.iterations, self.image, x, y, w, h, values, colors)
+		self.dirtyTop = min(self.dirtyTop, y.min())
+		self.dirtyBottom = max(self.dirtyBottom, (y + h).max())
+
+	def tick(self): # trace the next batchSize rectangles, or anti-alias the next pixelsPerTick edge pixels
+		t = time.time()
+		if self.pending:
+			self.trace()
+		elif self.AA > 1 and self.edges is None:
+			self.edges = np.flatnonzero(edgeMask(self.traced, self.edgeThreshold))
+		elif self.edges is not None and self.position < len(self.edges):
+			self.antialias()
+		elif self.preview and coordinateType(self) is np.float32:
+			self.escalate()
+		else:
+			return False
+		if self.tickBudget:
+			ratio = min(max(self.tickBudget/max(time.time()-t, 1e-6), .5), 2) # limit the change per tick to avoid oscillating
+			if self.edges is None:
+				self.batchSize = max(1, int(self.batchSize*ratio))
+			else:
+				self.pixelsPerTick = max(16, int(self.pixelsPerTick*ratio))
+		return True
+
+	def trace(self): # render the borders of a batch of rectangles, then fill each uniform one and split the rest
+		x, y, w, h = self.take(self.batchSize).T.copy()
+		xs, ys, starts = lattice.rectBorders(x, y, w, h)
+		tx, ty = lattice.unrendered(self.traced, xs, ys, SampleGrid.missing, SampleGrid.pending) # neighbouring rectangles share their borders
+		if len(tx):
+			values = renderSamples(self, tx, ty, [(.5, .5)]).astype(np.float32)
+			self.traced[ty, tx] = values
+			self.rendered += len(tx)
+			ones = np.ones(len(tx), dtype = np.int64)
+			self.paint(tx, ty, ones, ones, values)
+		uniform, mean = lattice.borderStats(self.traced, xs, ys, starts)
+		inside = (w > 2) & (h > 2) # narrower rectangles are all border
+		if inside.any(): # fill uniform insides for good, and show the rest as their border's mean until they're split
+			i = np.flatnonzero(inside)
+			self.paint(x[i]+1, y[i]+1, w[i]-2, h[i]-2, mean[i])
+			fill = np.flatnonzero(inside & uniform)
+			lattice.fillRects(self.traced, x[fill]+1, y[fill]+1, w[fill]-2, h[fill]-2, mean[fill])
+		split = np.flatnonzero(inside & ~uniform)
+		if len(split):
+			x, y, w, h = x[split], y[split], w[split], h[split]
+			mx, my = x + w//2, y + h//2 # the children share the middle row and column, so each is bounded by rendered pixels
+			self.pending.append(np.stack((
+				np.concatenate((x, mx, x, mx)),
+				np.concatenate((y, y, my, my)),
+				np.concatenate((mx-x+1, x+w-mx, mx-x+1, x+w-mx)),
+				np.concatenate((my-y+1, my-y+1, y+h-my, y+h-my))), axis = 1))
+
+	def antialias(self): # render every AA sample of the next edge pixels
+		batch = self.edges[self.position:self.position + self.pixelsPerTick]
+		ys, xs = np.divmod(batch, self.res)
+		values = (renderSamples(self, xs, ys, AAList[:self.AA])/self.AA).astype(np.float32)
+		self.rendered += len(batch)*self.AA
+		ones = np.ones(len(batch), dtype = np.int64)
+		self.paint(xs, ys, ones, ones, values)
+		self.position += self.pixelsPerTick
+
+	def updateImage(self): # tick already draws each rectangle, so just return the rows drawn since the last call
+		top, bottom = self.dirtyTop, self.dirtyBottom
+		self.dirtyTop, self.dirtyBottom = self.res, 0
+		if bottom <= top:
+			return []
+		return [[0, int(top), self.res, int(bottom - top)]]
+
+	def fullUpdateImage(self): # recolor every pixel from the iteration buffer
+		self.image[:] = self.colorProfile.colorize(self.iterations, self.maxIters, self.sampleCount(), self.colorSlice)
+		return [[0, 0, self.res, self.res]]
 
 
 class RealtimeQuadRenderer(): # the realtime quadtree renderer
+	float32Kernels = True
+
 	def __init__(self, res = 512, AA = 0, maxIters = 100):
 		self.res = res
 		self.AA = AA
 		self.maxIters = maxIters
+		self.periodicity = True
 		self.colorProfile = ColorConverter()
 		self.colorSlice = 0
+		self.batchSize = 1 # the number of quads subdivided per tick
+		self.tickBudget = None # if set, batchSize is tuned each tick so a tick takes about this many seconds
+		self.dirtyTile = 32 # the granularity of the rectangles updateImage returns
+		self.cache = None # a tilecache.TileCache shared between renderers, which keeps the samples of views rendered before
+		self.cacheSlot = None # where this view's samples go in the cache, if its camera is aligned to the cache's lattice
+		self.samples = None
+		self.precision = "auto" # float32 while zoomed out, see coordinateType
+		self.preview = True # see ScanRenderer
+		self.smooth = False # see FullRenderer
+		self.edgeThreshold = .25 # with smooth set, a quad whose samples are all within this many iterations isn't subdivided, since smooth samples are never exactly equal
 
 		self.cam = Camera(res, res, xPos = -.5)
 
 	def sparseRender(self, x, y, size):
-		# render a quad, referencing the sparse array if applicable
-		half = size/2
-		pixelList = [(x, y), (x+size, y+size), (x+size, y), (x, y+size), (x+half, y+half), (x+half, y), (x, y+half), (x+half, y+size), (x+size, y+half)]
-		pix = []
-		for i in pixelList:
-			if len(pix) > self.AA+2:
-				break
-			if i in self.sparseArray:
-				pix.append(self.sparseArray[i])
-			else:
-				pix.append(self.renderPixel(self.cam.convertPos(i[0], i[1])))
-				self.sparseArray[i] = pix[-1]
-		return pix
+		# render arrays of quads, referencing the sample grid if applicable. Returns a row of samples per quad
+		xs, ys = lattice.quadPoints(x, y, size, samplePattern[:self.AA+3])
+		return self.samples.fetch(xs, ys, self.renderLattice).reshape(len(x), -1)
+
+	def renderLattice(self, xs, ys): # render arrays of pixel space points
+		return kernel(self, self.cam.convertPos(xs, ys))
 
 	def renderPixel(self, coords):
 		return mandelbrot.render(coords[0], coords[1], self.maxIters)
 
-	def begin(self): # begin or restart the render (e.g. when the position changes)
+	def renderPoints(self, coords):
+		render = mandelbrot.renderSmoothArray if self.smooth else mandelbrot.renderArray
+		return render(coords[0], coords[1], self.maxIters, self.periodicity)
+
+	def cacheKey(self): # everything besides the camera which changes the samples, so only matching renderers share cached tiles
+		return (type(self).__name__, self.maxIters, coordinateType(self).__name__, self.smooth)
+
+	def cacheSamples(self): # keep this view's samples in the cache, e.g. before the renderer is replaced
+		if self.cache is not None and self.samples is not None:
+			self.cache.store(self.cacheSlot, self.samples.grid)
+
+	def begin(self, samples = None, preview = True): # begin or restart the render (e.g. when the position changes), optionally from a grid of known samples
+		self.cacheSamples()
+		self.preview = preview
 		self.image = np.zeros(shape=(self.res, self.res, 3), dtype=np.uint8)
-		self.sparseArray = {}
-		self.sortLimit = 10
+		self.iterations = np.zeros(shape=(self.res, self.res), dtype=np.float32) # the mean iterations of the quad covering each pixel
+		self.samples = samples if samples is not None else SampleGrid(self.res, self.cacheKey())
+		if self.cache is not None:
+			self.cacheSlot = self.cache.slot(self)
+			self.cache.load(self.cacheSlot, self.samples.grid)
+		self.quads = QuadTree()
+		self.placeholder = False # while set, quads which still need subdividing are not drawn over the warped previous image
 		s1 = self.res//2
 		s2 = self.res//4
 		s3 = s1+s2
-		self.quadList = [
-		Quad(0 , 0 , s2, self.sparseRender(0 , 0 , s2)),
-		Quad(0 , s1, s2, self.sparseRender(0 , s1, s2)),
-		Quad(s1, 0 , s2, self.sparseRender(s1, 0 , s2)),
-		Quad(s1, s1, s2, self.sparseRender(s1, s1, s2)), # the 4 top left subdivisions
-
-		Quad(s2, 0 , s2, self.sparseRender(s2, 0 , s2)),
-		Quad(s2, s1, s2, self.sparseRender(s2, s1, s2)),
-		Quad(s3, 0 , s2, self.sparseRender(s3, 0 , s2)),
-		Quad(s3, s1, s2, self.sparseRender(s3, s1, s2)), # the 4 top right subdivisions
-
-		Quad(0 , s2, s2, self.sparseRender(0 , s2, s2)),
-		Quad(0 , s3, s2, self.sparseRender(0 , s3, s2)),
-		Quad(s1, s2, s2, self.sparseRender(s1, s2, s2)),
-		Quad(s1, s3, s2, self.sparseRender(s1, s3, s2)), # the 4 bottom left subdivisions
-
-		Quad(s2, s2, s2, self.sparseRender(s2, s2, s2)),
-		Quad(s2, s3, s2, self.sparseRender(s2, s3, s2)),
-		Quad(s3, s2, s2, self.sparseRender(s3, s2, s2)),
-		Quad(s3, s3, s2, self.sparseRender(s3, s3, s2))] # the 4 bottom right subdivisions
-
-	def tick(self): # subdivide and update the highest priority quad
-		self.sortLimit -= 1
-		if self.sortLimit <= 0 or self.quadList[0].priority == 0:
-			if self.quadList[0].priority == 0:
-				self.quadList.pop(0)
-			self.quadList.sort(key = lambda q: int(q.priority), reverse = True)
-			self.sortLimit = len(self.quadList)//2
-		if self.quadList[0].priority == 0:
+		x, y = np.meshgrid((0, s2, s1, s3), (0, s2, s1, s3)) # the 16 starting subdivisions
+		self.addQuads(x.ravel(), y.ravel(), np.full(16, s2))
+
+	def beginFrom(self, xPos, yPos, zoom): # restart the render after the camera moved from xPos, yPos, zoom, reusing what the previous view rendered
+		scale = zoom/self.cam.zoom
+		dx = (xPos - self.cam.xPos)*self.res/self.cam.zoom # where the previous view's origin lands in the new pixel space
+		dy = (self.cam.yPos - yPos)*self.res/self.cam.zoom
+		self.preview = True # the new view is previewed again, so its grid only takes the old samples if they're in the preview's precision too
+		samples = SampleGrid(self.res, self.cacheKey())
+		if samples.key == self.samples.key:
+			samples.reproject(self.samples, scale, dx, dy) # only whole pixel pans and power of two zooms land on the new lattice
+		import cv2
+		warp = np.array([[scale, 0, dx + scale/2 - .5], [0, scale, dy + scale/2 - .5]]) # the same mapping between pixel centers for OpenCV
+		image = cv2.warpAffine(self.image, warp, (self.res, self.res), flags = cv2.INTER_NEAREST)
+		iterations = cv2.warpAffine(self.iterations, warp, (self.res, self.res), flags = cv2.INTER_NEAREST)
+		self.begin(samples)
+		self.image, self.iterations = image, iterations
+		self.placeholder = True
+
+	def sampleCount(self):
+		return len(samplePattern[:self.AA+3])
+
+	def escalate(self): # render the converged float32 preview again in float64, showing the preview until each quad is final
+		image, iterations = self.image, self.iterations
+		self.begin(preview = False)
+		self.image, self.iterations = image, iterations
+		self.placeholder = True
+
+	def loadBuffer(self, iterations): # show a saved iteration buffer in place of rendering
+		self.cacheSamples()
+		self.preview = False
+		self.image = np.zeros(shape=(self.res, self.res, 3), dtype=np.uint8)
+		self.iterations = iterations
+		self.samples = SampleGrid(self.res, self.cacheKey())
+		self.cacheSlot = None
+		self.quads = QuadTree()
+		self.placeholder = False
+		self.fullUpdateImage()
+
+	def addQuads(self, x, y, size, reuse = ()): # render and store new quads, overwriting the slots in reuse first
+		self.quads.add(x, y, size, self.sparseRender(x, y, size), reuse, self.edgeThreshold if self.smooth else 0.0)
+
+	def tick(self): # subdivide and update the batchSize highest priority quads
+		t = time.time()
+		current = self.quads.pop(self.batchSize)
+		if not len(current):
+			if self.preview and coordinateType(self) is np.float32:
+				self.escalate()
+				return True
 			return False
-		current = self.quadList.pop(0)
-		newSize = current.size//2
-		for j in [(current.x, current.y), (current.x+newSize, current.y), (current.x, current.y+newSize), (current.x+newSize, current.y+newSize)]:
-			self.quadList.append(Quad(j[0], j[1], newSize, self.sparseRender(j[0], j[1], newSize)))
+		x, y, size = self.quads.x[current], self.quads.y[current], self.quads.size[current]
+		newSize = size//2
+		self.addQuads(np.concatenate((x, x+newSize, x, x+newSize)), np.concatenate((y, y, y+newSize, y+newSize)), np.concatenate((newSize, newSize, newSize, newSize)), current) # the first child replaces its parent
+		if self.tickBudget:
+			ratio = min(max(self.tickBudget/max(time.time()-t, 1e-6), .5), 2) # limit the change per tick to avoid oscillating
+			self.batchSize = max(1, int(self.batchSize*ratio))
 		return True
 
-	def updateImage(self): # update the image (e.g. to display it while rendering)
-		#t = time.time()
-		for q in self.quadList:
-			if not q.updated:
-				c = self.colorProfile.convert(q.color/self.maxIters)
-				self.image[q.y:q.y+q.size, q.x:q.x+q.size] = np.append(c[self.colorSlice:], c[:self.colorSlice])
-				q.updated = True
-		#print(time.time() - t)
+	def updateImage(self): # update the image (e.g. to display it while rendering), returning the (x, y, width, height) rectangles it changed
+		q = self.quads
+		if self.placeholder:
+			new = np.flatnonzero(~q.updated[:q.count] & (q.priority[:q.count] == 0))
+		else:
+			new = np.flatnonzero(~q.updated[:q.count])
+		colors = self.colorProfile.colorize(q.color[new], self.maxIters, self.sampleCount(), self.colorSlice, self.smooth)
+		with stats.timed("paint"):
+			lattice.paintQuads(self.iterations, self.image, q.x[new], q.y[new], q.size[new], q.color[new], colors)
+		q.updated[new] = True
+		return lattice.dirtyRects(q.x[new], q.y[new], q.size[new], self.res, self.dirtyTile).tolist()
 
-	def fullUpdateImage(self): # update the entire image (e.g. when the color changes)
-		# This is a VERY expensive operation, and can take upwards of a second on a 1024x1024 image
-		for q in self.quadList:
-			c = self.colorProfile.convert(q.color/self.maxIters)
-			self.image[q.y:q.y+q.size, q.x:q.x+q.size] = np.append(c[self.colorSlice:], c[:self.colorSlice])
-			q.updated = True
+	def fullUpdateImage(self): # update the entire image (e.g. when the color changes) by recoloring the iteration buffer
+		self.updateImage()
+		self.image[:] = self.colorProfile.colorize(self.iterations, self.maxIters, self.sampleCount(), self.colorSlice, self.smooth)
+		return [[0, 0, self.res, self.res]]
 
 
 class RealtimeJuliaQuadRenderer(RealtimeQuadRenderer):
@@ -225,6 +717,13 @@ class RealtimeJuliaQuadRenderer(RealtimeQuadRenderer):
 	def renderPixel(self, coords):
 		return julia.render(coords[0], coords[1], self.cx, self.cy, self.maxIters)
 
+	def renderPoints(self, coords):
+		render = julia.renderSmoothArray if self.smooth else julia.renderArray
+		return render(coords[0], coords[1], self.cx, self.cy, self.maxIters, self.periodicity)
+
+	def cacheKey(self):
+		return super().cacheKey() + (self.cx, self.cy)
+
 
 class RealtimeCactusQuadRenderer(RealtimeQuadRenderer):
 	def __init__(self, res = 512, AA = 0, maxIters = 100):
@@ -234,8 +733,14 @@ class RealtimeCactusQuadRenderer(RealtimeQuadRenderer):
 	def renderPixel(self, coords):
 		return cactus.render(coords[0], coords[1], self.maxIters)
 
+	def renderPoints(self, coords):
+		render = cactus.renderSmoothArray if self.smooth else cactus.renderArray
+		return render(coords[0], coords[1], self.maxIters, self.periodicity)
+
 
 class RealtimeGradientQuadRenderer(RealtimeQuadRenderer):
+	float32Kernels = False
+
 	def __init__(self, res = 512, AA = 0, maxIters = 100):
 		super().__init__(res, AA, maxIters)
 		self.cam = Camera(res, res, xPos = .5, zoom = 1)
@@ -243,42 +748,282 @@ class RealtimeGradientQuadRenderer(RealtimeQuadRenderer):
 	def renderPixel(self, coords):
 		return gradient.render(coords[0], coords[1], self.maxIters)
 
+	def renderPoints(self, coords):
+		return gradient.renderArray(coords[0], coords[1], self.maxIters)
+
+
+class RealtimeDeepQuadRenderer(RealtimeQuadRenderer): # the quadtree renderer using perturbation theory, for zooms beyond float64 precision
+	float32Kernels = False # perturbation needs every bit of its offsets
+
+	def __init__(self, res = 512, AA = 0, maxIters = 100):
+		super().__init__(res, AA, maxIters)
+		self.cam = DeepCamera(res, res, xPos = -.5)
+		self.reference = None
+
+	def renderPixel(self, coords):
+		return deepzoom.render(coords[0], coords[1], *deepReference(self), self.maxIters)
+
+	def renderPoints(self, coords):
+		return deepzoom.renderArray(coords[0], coords[1], *deepReference(self), self.maxIters)
 
-class Quad():
-	def __init__(self, x, y, size, colorList):
-		self.x = x
-		self.y = y
-		self.size = size
-		self.color = sum(colorList)/len(colorList) # the scalar color of the quad (based on iterations till convergence)
-		self.updated = False # each quad keeps track of whether it has been added to the image or not
-		if size <= 1:
-			self.priority = 0
-		else:
-			if len(set(colorList)) > 1:
-				self.priority = self.color*size*size
-			else:
-				self.priority = 0
+
+class FormulaRenderer(): # the plugin interface for user formulas: mixed in ahead of any renderer class, it renders self.formula in place of the built in fractal
+	formula = formula.Formula("z**2 + c") # a formula.Formula, compiled the first time it renders
+	julia = False # render the Julia set of cx, cy instead of the parameter plane
+	float32Kernels = False # formulas iterate in complex128, so float32 points would gain nothing
+	cx = .3
+	cy = .5
+
+	def renderPixel(self, coords):
+		if self.julia:
+			return self.formula.render(coords[0], coords[1], self.cx, self.cy, self.maxIters, self.periodicity)
+		return self.formula.render(coords[0], coords[1], coords[0], coords[1], self.maxIters, self.periodicity)
+
+	def renderPoints(self, coords):
+		return self.formula.renderArray(coords[0], coords[1], self.cx, self.cy, self.julia, self.maxIters, self.periodicity)
+
+	def cacheKey(self): # only used by the realtime renderer
+		return super().cacheKey() + (self.formula.key, self.julia, self.cx, self.cy)
+
+
+class FormulaFullRenderer(FormulaRenderer, FullRenderer):
+	def render(self, previous = None):
+		self.formula.compile() # compile once, before the tiles are spread across threads
+		return super().render(previous)
+
+
+class FormulaScanRenderer(FormulaRenderer, ScanRenderer):
+	pass
+
+
+class RealtimeFormulaQuadRenderer(FormulaRenderer, RealtimeQuadRenderer):
+	pass
+
+
+def deepReference(renderer): # the reference orbit at the center of a deep renderer's view, computed again only when the view changes
+	key = (renderer.cam.center(), renderer.cam.zoom, renderer.maxIters)
+	if renderer.reference is None or renderer.reference[0] != key:
+		renderer.reference = (key, deepzoom.referenceOrbit(*key[0], renderer.maxIters, renderer.cam.zoom))
+	return renderer.reference[1]
+
+
+class RenderWorker(threading.Thread): # ticks a realtime renderer on its own thread, publishing its image about every frameBudget seconds so the UI thread only has to show it
+	# the UI thread hands it changes with submit rather than making them itself, so moving the view never computes on the UI thread
+	def __init__(self, renderer, frameBudget = 1/60):
+		super().__init__(daemon = True)
+		self.renderer = renderer
+		self.frameBudget = frameBudget
+		self.lock = threading.RLock() # held while rendering; use the worker as a context manager to change the renderer
+		self.waiting = 0 # threads waiting for the lock, which the worker steps aside for
+		self.wake = threading.Event() # set while the renderer has work left
+		self.frame = None # the latest published image and the rectangles changed since the UI last took one
+		self.frameLock = threading.Lock()
+		self.jobs = deque() # changes to the renderer queued by other threads, which this thread makes between frames
+		self.wake.set()
+		self.start()
+
+	def __enter__(self): # pause rendering, e.g. to change the renderer or its settings
+		self.waiting += 1
+		self.lock.acquire()
+		self.waiting -= 1
+		return self
+
+	def __exit__(self, *exc): # show the changed renderer and carry on rendering
+		self.publish()
+		self.lock.release()
+		self.wake.set()
+
+	def submit(self, job): # make a change to the renderer on this thread before its next frame, so the caller doesn't wait for it
+		if threading.current_thread() is self: # a queued change making another
+			job()
+			return
+		self.jobs.append(job)
+		self.wake.set()
+
+	def runJobs(self): # make the queued changes, then show the whole changed image
+		while self.jobs:
+			try:
+				self.jobs.popleft()()
+			except Exception:
+				traceback.print_exc() # as the UI thread would have, without stopping the worker
+		self.publish()
+
+	def run(self):
+		while True:
+			self.wake.wait()
+			while self.waiting: # let the UI thread in, since it may not get the lock back from this loop otherwise
+				time.sleep(.001)
+			with self.lock:
+				if self.jobs:
+					self.runJobs()
+				end = time.perf_counter() + self.frameBudget
+				ticked = False
+				while time.perf_counter() < end and not self.jobs: # queued changes make the rest of this frame's work stale
+					with stats.timed("tick"):
+						more = self.renderer.tick()
+					if not more:
+						self.wake.clear() # done until the renderer changes
+						if self.jobs: # queued after the tick began, so its wake up was just cleared
+							self.wake.set()
+						break
+					ticked = True
+				if ticked:
+					with stats.timed("update image"):
+						rects = self.renderer.updateImage()
+					self.publish(rects)
+
+	def publish(self, rects = None): # hand the image to the UI thread with the (x, y, width, height) rectangles that changed, or all of it
+		image = self.renderer.image
+		if rects is None:
+			rects = [[0, 0, image.shape[1], image.shape[0]]]
+		if not rects:
+			return
+		with self.frameLock:
+			if self.frame is not None and self.frame[0] is image: # the UI hasn't taken the last frame yet, so it needs both sets of changes
+				rects = self.frame[1] + rects
+			self.frame = (image, rects)
+
+	def take(self): # the image and its changed rectangles published since the last call, or None
+		# the image isn't copied, so a rectangle may be read mid paint, but anything painted after publishing is in the next frame's rectangles
+		with self.frameLock:
+			frame, self.frame = self.frame, None
+		return frame
+
+
+class QuadTree(): # the leaves of the quadtree, stored as parallel arrays with a heap of the quads left to subdivide
+	def __init__(self, capacity = 1024):
+		self.x = np.zeros(capacity, dtype = np.int32)
+		self.y = np.zeros(capacity, dtype = np.int32)
+		self.size = np.zeros(capacity, dtype = np.int32)
+		self.color = np.zeros(capacity) # the scalar color of each quad (based on iterations till convergence)
+		self.priority = np.zeros(capacity)
+		self.updated = np.zeros(capacity, dtype = bool) # whether each quad has been added to the image or not
+		self.count = 0
+		self.heap = [] # (-priority, index) of every quad which still needs subdividing
+
+	def __len__(self):
+		return self.count
+
+	def grow(self): # double the capacity of every array
+		for name in ('x', 'y', 'size', 'color', 'priority', 'updated'):
+			old = getattr(self, name)
+			new = np.zeros(len(old)*2, dtype = old.dtype)
+			new[:len(old)] = old
+			setattr(self, name, new)
+
+	def add(self, x, y, size, colors, reuse = (), tolerance = 0.0): # store arrays of leaves with a row of samples each, overwriting the slots in reuse first, see lattice.quadStats for tolerance
+		new = len(x) - len(reuse)
+		while self.count + new > len(self.x):
+			self.grow()
+		index = np.concatenate((np.asarray(reuse, dtype = np.intp), np.arange(self.count, self.count + new)))
+		self.count += new
+		color, priority = lattice.quadStats(colors, size, tolerance)
+		self.x[index] = x
+		self.y[index] = y
+		self.size[index] = size
+		self.color[index] = color
+		self.priority[index] = priority
+		self.updated[index] = False
+		subdivide = np.flatnonzero(priority > 0)
+		with stats.timed("heap"):
+			for p, i in zip((-priority[subdivide]).tolist(), index[subdivide].tolist()):
+				heapq.heappush(self.heap, (p, i))
+		if stats.enabled:
+			stats.add("quads", len(x))
+			stats.add("heap pushes", len(subdivide))
+		return index
+
+	def pop(self, count = 1): # remove and return the indices of up to count of the highest priority quads
+		with stats.timed("heap"):
+			return np.array([heapq.heappop(self.heap)[1] for i in range(min(count, len(self.heap)))], dtype = np.intp)
+
+
+class SampleGrid(): # a dense cache of the samples on the half pixel lattice used by the quadtree
+	missing = -1 # marks a sample which has not been rendered yet
+	pending = -2 # marks a sample which is being rendered in the current batch
+
+	def __init__(self, res, key = None):
+		self.grid = np.full((2*res+1, 2*res+1), self.missing, dtype = np.float32) # indexed [2y][2x]
+		self.key = key # the cacheKey of the renderer which rendered the samples, so a view that renders differently (e.g. in float64) doesn't reuse them
+
+	def fetch(self, xs, ys, render): # look up the samples at xs, ys, rendering the missing ones in a single batch
+		values, todo = lattice.gather(self.grid, xs, ys, self.missing, self.pending)
+		if stats.enabled:
+			stats.add("grid hits", len(xs) - len(todo))
+			stats.add("grid misses", len(todo))
+		if len(todo):
+			values = lattice.scatter(self.grid, xs, ys, values, todo, render(xs[todo], ys[todo]))
+		return values
+
+	def reproject(self, old, scale, dx, dy): # copy the samples of another grid which land on this lattice after scaling its pixel space by scale and shifting it by dx, dy
+		level = np.log2(scale)
+		if abs(level - round(level)) > 1e-9 or abs(dx*2 - round(dx*2)) > 1e-6 or abs(dy*2 - round(dy*2)) > 1e-6:
+			return 0
+		jx, ix = alignedIndices(len(self.grid), len(old.grid), 2.0**round(level), round(dx*2))
+		jy, iy = alignedIndices(len(self.grid), len(old.grid), 2.0**round(level), round(dy*2))
+		self.grid[np.ix_(jy, jx)] = old.grid[np.ix_(iy, ix)]
+		return np.count_nonzero(self.grid != self.missing)
+
+
+def alignedIndices(n, oldN, scale, offset): # the indices along one axis of a lattice of n points, and of an old lattice of oldN points, which map onto each other
+	j = np.arange(n)
+	i = (j - offset)/scale
+	valid = (i == np.round(i)) & (i >= 0) & (i < oldN)
+	return j[valid], i[valid].astype(np.intp)
+
+
+def saveIterations(renderer, path): # save a renderer's iteration buffer with the settings needed to color it again
+	np.savez_compressed(path, iterations = renderer.iterations, maxIters = renderer.maxIters, samples = renderer.sampleCount(), smooth = renderer.smooth,
+		xPos = str(renderer.cam.xPos), yPos = str(renderer.cam.yPos), zoom = renderer.cam.zoom, renderer = type(renderer).__name__)
+
+
+def loadIterations(renderer, path): # load a saved iteration buffer into a renderer of the same resolution, so it can be restyled without rendering
+	data = np.load(path)
+	if data['iterations'].shape != (renderer.cam.yRes, renderer.cam.xRes):
+		raise ValueError("Saved iterations are " + str(data['iterations'].shape) + ", but the renderer is " + str((renderer.cam.yRes, renderer.cam.xRes)))
+	renderer.maxIters = int(data['maxIters'])
+	position = Fraction if isinstance(renderer.cam, DeepCamera) else float # positions are saved as strings so a DeepCamera's stay exact
+	renderer.cam.xPos = position(str(data['xPos']))
+	renderer.cam.yPos = position(str(data['yPos']))
+	renderer.cam.zoom = float(data['zoom'])
+	renderer.smooth = bool(data['smooth']) if 'smooth' in data.files else False # so the buffer is colored at the levels it was rendered with
+	renderer.loadBuffer(data['iterations'])
+	return str(data['renderer'])
 
 
 class ColorConverter():
 	def __init__(self, profileName = "greyscale"):
 		self.loadProfile(profileName)
 		self.multiple = 1
+		self.lutKey = None
 
 	def loadProfile(self, profileName):
 		self.profileName = profileName
 		if profileName != "greyscale":
+			import cv2
 			self.ramp = cv2.imread("color_profiles/" + profileName + ".bmp")[0]
 
-	def convert(self, scalar): # take a ratio and convert it to an RGB int ala Blender's Color Ramp node
-		if scalar == 0: # exception for converging quads
-			return(0, 0, 0)
-		if self.profileName == "greyscale":
-			l = 512
-			c = int(scalar**.25*self.multiple*l%l)
-			return (c, c, c)
-		l = len(self.ramp)
-		return self.ramp[int(scalar**.25*self.multiple*l%l)]
+	def lookupTable(self, maxIters, samples, colorSlice = 0): # the color of every mean iteration count in steps of 1/samples, rebuilt only when a setting changes
+		key = (self.profileName, self.multiple, maxIters, samples, colorSlice)
+		if key != self.lutKey:
+			scalar = np.arange(maxIters*samples+1)/samples/maxIters
+			if self.profileName == "greyscale":
+				l = 512
+				c = (scalar**.25*self.multiple*l%l).astype(np.intp).astype(np.uint8)
+				colors = np.stack((c, c, c), axis = 1)
+			else:
+				l = len(self.ramp)
+				colors = self.ramp[(scalar**.25*self.multiple*l%l).astype(np.intp)]
+			colors[0] = 0 # exception for converging quads
+			self.lut = np.roll(colors, -colorSlice, axis = 1)
+			self.lutKey = key
+		return self.lut
+
+	def colorize(self, iterations, maxIters, samples, colorSlice = 0, smooth = False): # convert an array of mean iteration counts to BGR colors in one pass
+		levels = samples*smoothLevels if smooth else samples # continuous counts need finer steps than the mean of whole iterations
+		with stats.timed("color"):
+			lut = self.lookupTable(maxIters, levels, colorSlice)
+			return lut[np.clip(np.rint(iterations*levels), 0, len(lut)-1).astype(np.intp)]
 
 
 class Camera(): # This class is responsible for handling the conversion from pixel position to mathematical space
@@ -302,57 +1047,37 @@ class Camera(): # This class is responsible for handling the conversion from pix
 	def convertY(self, y): # convert a y coordinate from math to pixel space
 		return y*self.zoom/self.yRes-self.yPos
 
+	def move(self, x, y, zoom): # pan by x, y pixels and zoom in by a factor of zoom
+		zr = self.zoom/zoom
+		self.xPos -= x/self.xRes*zr
+		self.yPos += y/self.yRes*zr
+		self.zoom /= zoom
+
+
+class DeepCamera(Camera): # a camera with an exact position, which converts pixels to float offsets from the center of the view instead of absolute coordinates
+	def __init__(self, xRes, yRes, xPos = 0, yPos = 0, zoom = 2): # xPos and yPos may be strings of any length, e.g. "-1.7490863748149414"
+		super().__init__(xRes, yRes, 0, 0, zoom)
+		self.xPos = Fraction(xPos) - Fraction(zoom)/2
+		self.yPos = Fraction(yPos) + Fraction(zoom)/2
 
-@profile.profile
-def test(res = 512):
-	renderer = RealtimeQuadRenderer(res = res, AA = 8, maxIters = 1000)
-	renderer.begin()
-	while renderer.tick():
-		pass
-	renderer.updateImage()
-
-@profile.profile
-def test2(res = 512):
-	renderer = ScanRenderer(res = res, AA = 8, maxIters = 1000)
-	renderer.begin()
-	while renderer.tick():
-		pass
-	renderer.updateImage()
-
-@profile.profile
-def test3(res = 512):
-	renderer = RealtimeJuliaQuadRenderer(res = res, AA = 8, maxIters = 1000)
-	renderer.begin()
-	while renderer.tick():
-		pass
-	renderer.updateImage()
-
-@profile.profile
-def test4(res = 512):
-	renderer = JuliaScanRenderer(res = res, AA = 8, maxIters = 1000)
-	renderer.begin()
-	while renderer.tick():
-		pass
-	renderer.updateImage()
+	def center(self): # the exact coordinates at the center of the view, which perturbation rendering uses as its reference point
+		return self.xPos + Fraction(self.zoom)/2, Fraction(self.zoom)/2 - self.yPos
+
+	def convertX(self, x):
+		return (x - self.xRes/2)*self.zoom/self.xRes
+
+	def convertY(self, y):
+		return (y - self.yRes/2)*self.zoom/self.yRes
+
+	def move(self, x, y, zoom):
+		zr = self.zoom/zoom
+		self.xPos -= Fraction(x/self.xRes*zr)
+		self.yPos += Fraction(y/self.yRes*zr)
+		self.zoom /= zoom
+
+
+viewpoints = {"full": (-.5, 0, 3), "seahorse": (-.745, .1, .02), "elephant": (.28, .008, .02), "minibrot": (-1.7687, 0, .005)} # center x, center y and zoom of standard views
 
 if __name__ == "__main__":
-	# test a renderer
-	if not os.path.exists('renders'):
-		os.makedirs('renders')
-	maxIters = 10000
-	for res in (16, 32, 64, 128, 256, 512, 1024):
-		#renderer = RealtimeQuadRenderer(res = res, AA = 8, maxIters = maxIters)
-		#renderer = ScanRenderer(res = res, AA = 8, maxIters = maxIters)
-		#renderer = RealtimeJuliaQuadRenderer(res = res, AA = 8, maxIters = maxIters)
-		#renderer = JuliaScanRenderer(res = res, AA = 8, maxIters = maxIters)
-		#renderer = RealtimeCactusQuadRenderer(res = res, AA = 8, maxIters = maxIters)
-		renderer = CactusScanRenderer(res = res, AA = 8, maxIters = maxIters)
-		t = time.time()
-		renderer.begin()
-	
-		while renderer.tick():
-			pass
-	
-		renderer.updateImage()
-		print("Render time at " + str(res) + " "*(4-len(str(res))) + " was " + str(time.time() - t))
-		cv2.imwrite('renders/test' + str(res) + '.png', renderer.image)
\ No newline at end of file
+	from quadrenderer import benchmark # every renderer at the standard views, see benchmark.py for options
+	sys.exit(benchmark.main())
@@ -0,0 +1,64 @@
+import contextlib
+import os
+import threading
+import time
+
+# Opt-in counters and timers for the rendering hot paths. Each call site counts a whole batch at once, and checks enabled
+# (or goes through timed, which hands back a shared do-nothing context) first, so leaving this off costs a flag check per batch.
+
+enabled = os.environ.get("QUADRENDERER_STATS", "") not in ("", "0")
+counters = {} # name -> total
+timers = {} # name -> [seconds, calls], summed over threads, so stages on the render pool can pass the wall time
+off = contextlib.nullcontext()
+lock = threading.Lock() # the render pool's threads count into the same dicts, and += on them isn't atomic
+
+
+class Timer():
+	__slots__ = ("name", "start")
+
+	def __init__(self, name):
+		self.name = name
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+
+	def __exit__(self, *exc):
+		seconds = time.perf_counter() - self.start
+		with lock:
+			timer = timers.setdefault(self.name, [0.0, 0])
+			timer[0] += seconds
+			timer[1] += 1
+
+
+def timed(name): # time a stage with a with block, e.g. with stats.timed("kernel"):
+	return Timer(name) if enabled else off
+
+def add(name, n = 1): # only call when enabled
+	with lock:
+		counters[name] = counters.get(name, 0) + n
+
+def enable(on = True):
+	global enabled
+	enabled = on
+
+def reset():
+	with lock:
+		counters.clear()
+		timers.clear()
+
+def snapshot(): # a copy of every counter and timer, e.g. to report the change over an interval
+	with lock:
+		return {"counters": dict(counters), "timers": {name: tuple(timer) for name, timer in timers.items()}}
+
+def report(before = None, elapsed = None): # one line per counter and timer, as totals, or as rates per second since an earlier snapshot
+	now = snapshot()
+	before = before or {"counters": {}, "timers": {}}
+	scale = 1/elapsed if elapsed else 1
+	unit = "/s" if elapsed else ""
+	lines = []
+	for name, (seconds, calls) in sorted(now["timers"].items()):
+		oldSeconds, oldCalls = before["timers"].get(name, (0.0, 0))
+		lines.append("{:<16} {:>8.1f} ms{} {:>8.0f} calls{}".format(name, (seconds - oldSeconds)*1000*scale, unit, (calls - oldCalls)*scale, unit))
+	for name, total in sorted(now["counters"].items()):
+		lines.append("{:<16} {:>12,.0f}{}".format(name, (total - before["counters"].get(name, 0))*scale, unit))
+	return "\n".join(lines)
@@ -0,0 +1,153 @@
+import hashlib
+import math
+import os
+from collections import OrderedDict
+from fractions import Fraction
+import numpy as np
+from quadrenderer import stats
+
+# Samples of the quadtree renderers cached like a slippy map: the half pixel lattice of every view at one zoom is part of a single
+# world lattice, anchored at the origin, which is cut into square tiles. A view whose camera sits on that lattice can take any samples
+# an earlier view rendered there, so going back to somewhere already visited only has to render what was never seen.
+
+zoomSteps = 8 # the zoom levels per halving of the view, see align
+missing = -1 # as SampleGrid.missing
+
+def align(cam, steps = zoomSteps): # snap a camera to the nearest zoom level and lattice point, keeping its center, so its samples can be cached
+	zoom = 2.0**(round(math.log2(cam.zoom)*steps)/steps)
+	if isinstance(cam.xPos, Fraction): # a DeepCamera, whose position has to stay exact
+		spacing = Fraction(zoom)/(2*cam.xRes)
+		shift = (Fraction(cam.zoom) - Fraction(zoom))/2
+	else:
+		spacing = zoom/(2*cam.xRes)
+		shift = (cam.zoom - zoom)/2 # how far the lower left corner moves to keep the center
+	cam.xPos = round((cam.xPos + shift)/spacing)*spacing
+	cam.yPos = round((cam.yPos - shift)/spacing)*spacing
+	cam.zoom = zoom
+
+def origin(cam): # the world lattice index of the camera's (0, 0) sample, or None if the camera isn't on the lattice
+	spacing = Fraction(cam.zoom)/(2*cam.xRes) if isinstance(cam.xPos, Fraction) else cam.zoom/(2*cam.xRes)
+	x, y = cam.xPos/spacing, -cam.yPos/spacing
+	if abs(x - round(x)) > 1e-6 or abs(y - round(y)) > 1e-6:
+		return None
+	return round(x), round(y)
+
+
+class TileCache(): # rendered samples by (renderer key, lattice spacing, tile), least recently used first, with an optional directory they overflow to
+	def __init__(self, budget = 256*2**20, directory = None, diskBudget = 2*2**30, tileSize = 128):
+		self.budget = budget # bytes of tiles kept in memory
+		self.directory = directory
+		self.diskBudget = diskBudget # bytes of tiles kept in directory, oldest removed first
+		self.tileSize = tileSize # lattice points along each side of a tile
+		self.tiles = OrderedDict()
+		self.dirty = set() # keys of the tiles in memory which have samples the directory doesn't
+		self.bytes = 0
+		self.hits = 0 # samples taken from the cache
+		self.diskBytes = 0
+		if directory is not None:
+			os.makedirs(directory, exist_ok = True)
+			self.diskBytes = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.name.endswith(".npy"))
+
+	def slot(self, renderer): # where a renderer's samples belong in the cache, or None if its camera isn't on the lattice
+		start = origin(renderer.cam)
+		if start is None:
+			return None
+		return (renderer.cacheKey(), renderer.cam.zoom/(2*renderer.res)), start
+
+	def tileRange(self, start, length): # the tiles covering length lattice points from start along one axis
+		return range(start//self.tileSize, (start + length - 1)//self.tileSize + 1)
+
+	def store(self, slot, grid): # merge the rendered samples of a SampleGrid's grid into the cache
+		if slot is None:
+			return
+		key, (left, top) = slot
+		n = self.tileSize
+		for ty in self.tileRange(top, grid.shape[0]):
+			for tx in self.tileRange(left, grid.shape[1]):
+				x0, y0 = max(tx*n, left), max(ty*n, top)
+				x1, y1 = min(tx*n + n, left + grid.shape[1]), min(ty*n + n, top + grid.shape[0])
+				part = grid[y0-top:y1-top, x0-left:x1-left]
+				rendered = part >= 0
+				if not rendered.any():
+					continue
+				tile = self.get(key + (tx, ty))
+				if tile is None:
+					tile = np.full((n, n), missing, dtype = np.float32)
+					self.put(key + (tx, ty), tile)
+				view = tile[y0-ty*n:y1-ty*n, x0-tx*n:x1-tx*n]
+				if (view[rendered] != part[rendered]).any(): # grids hold the samples they loaded from here too, which change nothing
+					view[rendered] = part[rendered]
+					self.dirty.add(key + (tx, ty))
+
+	def load(self, slot, grid): # fill in the missing samples of a SampleGrid's grid from the cache, returning how many it found
+		if slot is None:
+			return 0
+		key, (left, top) = slot
+		n = self.tileSize
+		found = 0
+		for ty in self.tileRange(top, grid.shape[0]):
+			for tx in self.tileRange(left, grid.shape[1]):
+				tile = self.get(key + (tx, ty))
+				if tile is None:
+					continue
+				x0, y0 = max(tx*n, left), max(ty*n, top)
+				x1, y1 = min(tx*n + n, left + grid.shape[1]), min(ty*n + n, top + grid.shape[0])
+				part = grid[y0-top:y1-top, x0-left:x1-left]
+				cached = tile[y0-ty*n:y1-ty*n, x0-tx*n:x1-tx*n]
+				fill = (part < 0) & (cached >= 0)
+				part[fill] = cached[fill]
+				found += np.count_nonzero(fill)
+		self.hits += found
+		if stats.enabled:
+			stats.add("tile cache hits", found)
+		return found
+
+	def get(self, key): # a tile from memory, or from the directory, or None
+		tile = self.tiles.get(key)
+		if tile is not None:
+			self.tiles.move_to_end(key)
+			return tile
+		if self.directory is not None:
+			path = self.path(key)
+			if os.path.exists(path):
+				tile = np.load(path)
+				os.utime(path) # so the directory's budget removes the least recently used tiles first
+				self.put(key, tile)
+				return tile
+		return None
+
+	def put(self, key, tile): # add a tile to memory, evicting the least recently used ones past the budget
+		self.tiles[key] = tile
+		self.bytes += tile.nbytes
+		while self.bytes > self.budget and len(self.tiles) > 1:
+			oldKey, old = self.tiles.popitem(last = False)
+			self.bytes -= old.nbytes
+			if oldKey in self.dirty: # a clean tile is already in the directory, or was removed from it past its budget
+				self.dirty.discard(oldKey)
+				self.spill(oldKey, old)
+
+	def path(self, key):
+		return os.path.join(self.directory, hashlib.sha1(repr(key).encode()).hexdigest() + ".npy")
+
+	def spill(self, key, tile): # write an evicted tile to the directory, removing the oldest tiles there past its budget
+		if self.directory is None:
+			return
+		path = self.path(key)
+		if os.path.exists(path):
+			self.diskBytes -= os.path.getsize(path)
+		with open(path + ".tmp", "wb") as file:
+			np.save(file, tile)
+		os.replace(path + ".tmp", path)
+		self.diskBytes += os.path.getsize(path)
+		if self.diskBytes > self.diskBudget:
+			entries = sorted((entry for entry in os.scandir(self.directory) if entry.name.endswith(".npy")), key = lambda entry: entry.stat().st_mtime)
+			for entry in entries:
+				if self.diskBytes <= self.diskBudget*.9: # clear a little extra, so the directory isn't scanned on every spill
+					break
+				self.diskBytes -= entry.stat().st_size
+				os.remove(entry.path)
+
+	def flush(self): # write the tiles in memory which have new samples to the directory, e.g. before quitting
+		for key in self.dirty:
+			self.spill(key, self.tiles[key])
+		self.dirty.clear()
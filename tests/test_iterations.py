@@ -0,0 +1,23 @@
+import numpy as np
+from quadrenderer import renderer
+
+def finish(r):
+	r.begin()
+	while r.tick():
+		pass
+	r.updateImage()
+	return r
+
+def test_julia_round_trip(tmp_path):
+	saved = renderer.RealtimeJuliaQuadRenderer(res = 64, AA = 2, maxIters = 200)
+	saved.cam = renderer.Camera(64, 64, -.25, .1, 1.5)
+	saved.smooth = True
+	finish(saved)
+	path = str(tmp_path/"julia.npz")
+	renderer.saveIterations(saved, path)
+	loaded = renderer.RealtimeJuliaQuadRenderer(res = 64, AA = 2) # whose camera starts at an integer xPos
+	assert renderer.loadIterations(loaded, path) == "RealtimeJuliaQuadRenderer"
+	np.testing.assert_array_equal(loaded.iterations, saved.iterations)
+	np.testing.assert_array_equal(loaded.image, saved.image)
+	assert (loaded.cam.xPos, loaded.cam.yPos, loaded.cam.zoom) == (saved.cam.xPos, saved.cam.yPos, saved.cam.zoom)
+	assert loaded.maxIters == 200 and loaded.smooth
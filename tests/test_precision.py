@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from quadrenderer import renderer
+
+# With precision "auto" the interactive renderers preview shallow views in float32, and once that converges render them again in
+# float64, so what they finish with has to be exactly what a float64 render gives.
+
+def finish(r):
+	r.begin()
+	while r.tick():
+		pass
+	r.updateImage()
+	return r
+
+@pytest.mark.parametrize("cls", [renderer.RealtimeQuadRenderer, renderer.RealtimeJuliaQuadRenderer, renderer.RealtimeCactusQuadRenderer,
+	renderer.ScanRenderer, renderer.JuliaScanRenderer, renderer.CactusScanRenderer, renderer.BoundaryTraceRenderer])
+def test_auto_converges_to_float64(cls):
+	results = []
+	for precision in ("float64", "auto"):
+		r = cls(res = 128, AA = 4, maxIters = 1000)
+		r.precision = precision
+		if isinstance(r, renderer.ScanRenderer):
+			r.adaptive = True # as the application renders them
+		results.append(finish(r))
+	exact, auto = results
+	assert renderer.coordinateType(auto) is np.float64
+	np.testing.assert_array_equal(auto.iterations, exact.iterations)
+	np.testing.assert_array_equal(auto.image, exact.image)
+
+def test_auto_previews_in_float32():
+	r = renderer.RealtimeQuadRenderer(res = 128, AA = 4, maxIters = 1000)
+	r.begin()
+	assert renderer.coordinateType(r) is np.float32
+	r.smooth = True
+	assert renderer.coordinateType(r) is np.float64
@@ -0,0 +1,22 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from quadrenderer import stats
+
+def test_concurrent_counts():
+	interval = sys.getswitchinterval()
+	sys.setswitchinterval(1e-6) # switch threads as often as possible, which loses counts without the lock
+	try:
+		stats.reset()
+		def count(_):
+			for _ in range(20000):
+				stats.add("samples")
+				with stats.Timer("kernel"):
+					pass
+		with ThreadPoolExecutor(8) as pool:
+			list(pool.map(count, range(8)))
+		totals = stats.snapshot()
+		assert totals["counters"]["samples"] == 8*20000
+		assert totals["timers"]["kernel"][1] == 8*20000
+	finally:
+		sys.setswitchinterval(interval)
+		stats.reset()